@@ -0,0 +1,102 @@
+# Compares the sync deployment (gunicorn wsgi) with the async one (uvicorn asgi)
+# under the same concurrent load on the catalog read routes:
+#
+#   pipenv run python benchmarks/asgi_vs_wsgi.py --concurrency 64 --requests 5000
+#
+# Both servers run against the same database, the SQLite file given by
+# --database-url (re-created and seeded on every run, so never point it at a
+# database you care about), with the response cache disabled, so every request
+# reaches the database. DATABASE_URL from .env is deliberately ignored.
+# Prints throughput and latency percentiles for each server.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from common import SRC, free_port, gunicorn_command, uvicorn_command, start_server, run_load
+
+# Paths requested by every client, chosen at random per request
+PATHS = [
+    '/planets?limit=20',
+    '/planets?limit=20&sort=-population',
+    '/characters?limit=20&fields=id,name',
+    '/vehicles?limit=50',
+    '/planets/{id}',
+    '/characters/{id}'
+]
+
+
+def seed_database(url, rows):
+    # Creates the tables and fills the catalog with synthetic rows
+    sys.path.insert(0, SRC)
+    os.environ['DATABASE_URL'] = url
+    from app import create_app
+    from models import db, Characters, Planets, Vehicles
+
+    with create_app(admin=False, swagger=False, migrate=False).app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(db.insert(Planets), [
+            {'name': f'Planet {i}', 'climate': random.choice(('arid', 'temperate', 'frozen')), 'population': random.randint(0, 10 ** 9)}
+            for i in range(rows)
+        ])
+        db.session.execute(db.insert(Characters), [
+            {'name': f'Character {i}', 'gender': random.choice(('male', 'female', 'n/a')), 'height': random.randint(60, 250)}
+            for i in range(rows)
+        ])
+        db.session.execute(db.insert(Vehicles), [
+            {'name': f'Vehicle {i}', 'model': f'Model {i % 50}', 'cargo_capacity': random.randint(0, 10 ** 6)}
+            for i in range(rows)
+        ])
+        db.session.commit()
+
+def requests(total, rows):
+    return [('GET', random.choice(PATHS).format(id=random.randint(1, rows)), None) for _ in range(total)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the WSGI and ASGI deployments against each other')
+    parser.add_argument('--requests', type=int, default=2000, help='requests sent to each server')
+    parser.add_argument('--concurrency', type=int, default=32, help='clients sending requests at the same time')
+    parser.add_argument('--rows', type=int, default=1000, help='rows seeded per catalog table')
+    parser.add_argument('--workers', type=int, default=1, help='processes per server')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--database-url', default='sqlite:////tmp/benchmark.db',
+                        help='disposable database the tables are dropped, re-created and seeded in')
+    parser.add_argument('--no-seed', action='store_true', help='use --database-url as it is')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    url = args.database_url
+    if not args.no_seed:
+        seed_database(url, args.rows)
+
+    # WEB_CONCURRENCY tells the app how many workers share the database (uvicorn
+    # does not pass --workers on; gunicorn.conf.py sets it for gunicorn)
+    env = dict(os.environ, DATABASE_URL=url, RESPONSE_CACHE_MAX_ENTRIES='0', FLASK_DEBUG='0', WEB_CONCURRENCY=str(args.workers))
+    servers = {
+        'wsgi': lambda port: gunicorn_command(port, args.workers, args.threads),
+        'asgi': lambda port: uvicorn_command(port, args.workers)
+    }
+
+    results = {}
+    for name, command in servers.items():
+        port = free_port()
+        process = start_server(command(port), port, env)
+        try:
+            # Warm up connections, caches of compiled statements and the search/stats state
+            asyncio.run(run_load(port, requests(min(200, args.requests), args.rows), args.concurrency))
+            results[name] = asyncio.run(run_load(port, requests(args.requests, args.rows), args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+        print(name, json.dumps(results[name]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'workers': args.workers, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
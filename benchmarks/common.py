@@ -0,0 +1,116 @@
+# Helpers shared by the benchmark scripts: starting servers and a small asyncio
+# HTTP/1.1 load generator reporting throughput and latency percentiles.
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def gunicorn_command(port, workers=1, threads=4):
+    return [sys.executable, '-m', 'gunicorn', 'wsgi:application', '--chdir', SRC,
+            '-b', f'127.0.0.1:{port}', '-w', str(workers), '--threads', str(threads)]
+
+def uvicorn_command(port, workers=1):
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--app-dir', SRC,
+            '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{command[2]} did not start on port {port}')
+
+
+async def fetch(port, method, path, body, connection):
+    # One HTTP/1.1 request; reuses the connection while the server keeps it alive
+    if connection[0] is None:
+        connection[:] = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+
+    payload = b'' if body is None else json.dumps(body).encode()
+    head = f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\n'
+    if body is not None:
+        head += 'Content-Type: application/json\r\n'
+    head += f'Content-Length: {len(payload)}\r\n\r\n'
+    writer.write(head.encode() + payload)
+    await writer.drain()
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    headers = {}
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        headers[name.strip().lower()] = value.strip()
+
+    if b'content-length' in headers:
+        await reader.readexactly(int(headers[b'content-length']))
+    else:
+        await reader.read()
+        headers[b'connection'] = b'close'
+
+    if headers.get(b'connection', b'').lower() == b'close':
+        writer.close()
+        connection[:] = [None, None]
+    return status
+
+async def run_load(port, requests, concurrency):
+    # Sends the (method, path, body) requests from `concurrency` clients at once.
+    # Any status outside 2xx counts as an error.
+    latencies = []
+    errors = 0
+    remaining = iter(requests)
+
+    async def client():
+        nonlocal errors
+        connection = [None, None]
+        for method, path, body in remaining:
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, method, path, body, connection)
+            except (OSError, asyncio.IncompleteReadError):
+                status = None
+                connection[:] = [None, None]
+            latencies.append(time.perf_counter() - started)
+            if status is None or not 200 <= status < 300:
+                errors += 1
+        if connection[1] is not None:
+            connection[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summarize(latencies, elapsed, errors):
+    latencies.sort()
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
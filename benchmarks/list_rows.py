@@ -0,0 +1,98 @@
+# Compares the two ways of turning database rows into list responses, per row:
+# ORM instances (Model.query.all() + serialize()) against the Core row-tuple
+# path the list endpoints use (select_fields() + rows_to_dicts()):
+#
+#   pipenv run python benchmarks/list_rows.py --rows 50000 --runs 5
+#
+# Seeds the database given by --database-url with `flask generate` data, then for
+# the planets, characters and users tables fetches every row both ways and prints
+# the median CPU time per row and the peak memory allocated while doing it
+# (tracemalloc). Seeding deletes every row of that database, so it defaults to a
+# /tmp SQLite file and DATABASE_URL from .env is deliberately ignored.
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from common import SRC
+
+def seed(rows):
+    from generator import generate_dataset
+    from models import db, User, Planets, Characters
+    db.create_all()
+    generate_dataset({Planets: rows, Characters: rows, User: rows}, reset=True, echo=lambda *args: None)
+
+def orm_path(model):
+    from models import db
+    rows = [row.serialize() for row in model.query.all()]
+    # Drop the instances from the identity map, as the end of a request does
+    db.session.remove()
+    return rows
+
+def core_path(model):
+    from models import db
+    from utils import select_fields, rows_to_dicts
+    statement, names = select_fields(model, None)
+    rows = rows_to_dicts(names, db.session.execute(statement).all())
+    db.session.remove()
+    return rows
+
+def measure(path, model, runs):
+    cpu, peak = [], []
+    for _ in range(runs):
+        started = time.process_time()
+        count = len(path(model))
+        cpu.append((time.process_time() - started) / count)
+
+        # Memory is measured on a separate run: tracemalloc slows allocations down
+        tracemalloc.start()
+        path(model)
+        peak.append(tracemalloc.get_traced_memory()[1] / count)
+        tracemalloc.stop()
+    return {
+        'cpu_us_per_row': round(statistics.median(cpu) * 1e6, 2),
+        'peak_bytes_per_row': round(statistics.median(peak))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-row cost of ORM and Core list serialization')
+    parser.add_argument('--rows', type=int, default=20000, help='rows seeded per table')
+    parser.add_argument('--runs', type=int, default=5, help='measurements per table and path')
+    parser.add_argument('--database-url', default='sqlite:////tmp/benchmark_rows.db',
+                        help='disposable database whose rows are deleted and re-generated')
+    parser.add_argument('--no-seed', action='store_true', help='use --database-url as it is')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app
+    from models import User, Planets, Characters
+
+    results = {}
+    with create_app(admin=False, swagger=False, migrate=False).app_context():
+        if not args.no_seed:
+            seed(args.rows)
+
+        for model in (Planets, Characters, User):
+            # Same output both ways, then a warm-up of each path before measuring
+            assert orm_path(model) == core_path(model)
+            orm = measure(orm_path, model, args.runs)
+            core = measure(core_path, model, args.runs)
+            results[model.__tablename__] = {
+                'orm': orm,
+                'core': core,
+                'cpu_speedup': round(orm['cpu_us_per_row'] / core['cpu_us_per_row'], 2),
+                'memory_ratio': round(orm['peak_bytes_per_row'] / core['peak_bytes_per_row'], 2)
+            }
+            print(model.__tablename__, json.dumps(results[model.__tablename__]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Checks how many SQL statements the main endpoints run, with the query_budget()
+# helper of src/profiling.py, so a change that adds a query per row (an N+1) or a
+# round trip per request fails here instead of in production:
+#
+#   pipenv run python benchmarks/query_budgets.py
+#
+# Seeds the database given by --database-url with a small `flask generate`
+# dataset, then sends each request through the Flask test client inside its
+# budget and exits with status 1 if any is exceeded. Seeding deletes every row of
+# that database, so it defaults to a /tmp SQLite file and DATABASE_URL from .env is
+# deliberately ignored. The response cache is off so every request hits the database.
+
+import argparse
+import os
+import sys
+from common import SRC
+
+# (method, path, JSON body, max statements, max runs of one statement shape)
+BUDGETS = [
+    ('GET', '/characters?limit=50', None, 1, 1),
+    ('GET', '/planets?limit=50&sort=-population', None, 1, 1),
+    ('GET', '/planets/1', None, 1, 1),
+    ('GET', '/users?limit=50', None, 1, 1),
+    ('GET', '/users/favorites/1?expand=true', None, 5, 1),
+    ('POST', '/favorites/planets/1/2', None, 3, 1),
+    ('DELETE', '/favorites/planets/1/2', None, 3, 1),
+    ('POST', '/users/1/favorites:batch', {'operations': [
+        {'op': 'add', 'type': 'planet', 'id': 3}, {'op': 'add', 'type': 'planet', 'id': 4},
+        {'op': 'add', 'type': 'vehicle', 'id': 1}, {'op': 'remove', 'type': 'character', 'id': 1},
+        {'op': 'remove', 'type': 'character', 'id': 2}]}, 7, 1),
+    ('DELETE', '/characters/3', None, 3, 1),
+    ('DELETE', '/users/2', None, 2, 1),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the SQL statements run by the main endpoints against their budgets')
+    parser.add_argument('--database-url', default='sqlite:////tmp/query_budgets.db',
+                        help='disposable database whose rows are deleted and re-generated')
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+    from app import create_app
+    from generator import generate_dataset
+    from profiling import query_budget
+    from search import search_index
+    from models import db, User, Favorites, Characters, Planets, Species, Vehicles
+
+    app = create_app(admin=False, swagger=False, migrate=False)
+    with app.app_context():
+        db.create_all()
+        generate_dataset({Planets: 50, Characters: 50, Species: 50, Vehicles: 50, User: 10, Favorites: 100},
+                         reset=True, echo=lambda *args: None)
+
+    # Like the servers: the index build runs in its own thread and is not counted
+    search_index.start_build(app)
+    client = app.test_client()
+    failures = 0
+    for method, path, body, max_queries, max_repeats in BUDGETS:
+        try:
+            with query_budget(max_queries, max_repeats) as recorder:
+                response = client.open(path, method=method, json=body)
+            status = 'ok'
+        except AssertionError as error:
+            status = f'FAILED: {error}'
+            failures += 1
+        print(f'{method} {path}: {response.status_code}, {recorder.count} queries (budget {max_queries}) {status}')
+        if response.status_code >= 400:
+            print(f'  unexpected status {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            failures += 1
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Measures how long a worker takes to boot: a fresh interpreter importing
+# src/app.py and calling create_app(), with every feature on and API-only.
+#
+#   pipenv run python benchmarks/startup.py --runs 10
+#
+# Prints, per configuration, the median wall time of the whole process, of the
+# app import plus create_app(), and of create_app() alone (STARTUP_SECONDS).
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from common import SRC
+
+CONFIGURATIONS = {
+    'full': {'admin': True, 'swagger': True, 'migrate': True},
+    'api_only': {'admin': False, 'swagger': False, 'migrate': False}
+}
+
+BOOT = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {src!r})
+from app import create_app
+app = create_app(**{options!r})
+print(json.dumps({{'boot': time.perf_counter() - started, 'create_app': app.config['STARTUP_SECONDS']}}))
+'''
+
+def measure(options, runs):
+    process, boot, factory = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', BOOT.format(src=SRC, options=options)],
+                                check=True, capture_output=True, text=True).stdout
+        process.append(time.perf_counter() - started)
+        result = json.loads(output.strip().splitlines()[-1])
+        boot.append(result['boot'])
+        factory.append(result['create_app'])
+    return {
+        'process_ms': round(statistics.median(process) * 1000, 1),
+        'import_and_create_ms': round(statistics.median(boot) * 1000, 1),
+        'create_app_ms': round(statistics.median(factory) * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker boot time')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per configuration')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for name, options in CONFIGURATIONS.items():
+        results[name] = measure(options, args.runs)
+        print(name, json.dumps(results[name]))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
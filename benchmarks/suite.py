@@ -0,0 +1,150 @@
+# HTTP benchmark of every route family over seeded datasets of increasing size:
+#
+#   pipenv run python benchmarks/suite.py                      # SQLite, 1k/100k/1M rows
+#   pipenv run python benchmarks/suite.py --sizes 1k,100k --postgres-url postgresql://localhost/bench
+#   pipenv run python benchmarks/suite.py --sizes 1k --compare benchmarks/results/<older commit>.json
+#
+# For every database and size it reseeds the database (`flask generate`), boots
+# src/app.py under gunicorn with the response cache disabled, warms it up and
+# measures throughput and p50/p95/p99 latency per scenario. The results go to
+# benchmarks/results/<commit>.json so runs on two commits can be compared.
+# The random choices are seeded, so two runs send the same requests.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+from common import ROOT, free_port, gunicorn_command, start_server, run_load
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def regular_users(size):
+    return max(100, size // 10)
+
+def generate(env, size, disposable_users):
+    # size rows in every catalog table and favorites, plus users that delete_user may delete
+    subprocess.run([sys.executable, '-m', 'flask', '--app', os.path.join(ROOT, 'src', 'app.py'), 'generate',
+                    '--reset', '--create-tables', '--scale', str(size), '--planets', str(size), '--species', str(size),
+                    '--vehicles', str(size), '--users', str(regular_users(size) + disposable_users)], env=env, check=True)
+
+def scenarios(size, count, seed=0):
+    # {scenario: [(method, path, body)]}, run in this order. favorites_remove
+    # removes what favorites_add added; delete_user deletes the disposable users
+    # (the ids after the regular ones) with their favorites.
+    rand = random.Random(seed)
+    users = regular_users(size)
+    item = lambda: rand.randint(1, size)
+    user = lambda: rand.randint(1, users)
+
+    pairs = list({(user(), item()) for _ in range(count)})
+    return {
+        'list_characters': [('GET', '/characters?limit=20', None)] * count,
+        'list_planets': [('GET', '/planets?limit=20&sort=-population', None)] * count,
+        'list_species': [('GET', '/species?limit=20&sort=name', None)] * count,
+        'list_vehicles': [('GET', '/vehicles?limit=20&fields=id,name,model', None)] * count,
+        'list_users': [('GET', '/users?limit=20', None)] * count,
+        'get_character': [('GET', f'/characters/{item()}', None) for _ in range(count)],
+        'get_planet': [('GET', f'/planets/{item()}', None) for _ in range(count)],
+        'get_species': [('GET', f'/species/{item()}', None) for _ in range(count)],
+        'get_vehicle': [('GET', f'/vehicles/{item()}', None) for _ in range(count)],
+        'get_user': [('GET', f'/users/{user()}', None) for _ in range(count)],
+        'user_favorites': [('GET', f'/users/favorites/{user()}', None) for _ in range(count)],
+        'favorites_add': [('POST', f'/favorites/planets/{u}/{p}', None) for u, p in pairs],
+        'favorites_remove': [('DELETE', f'/favorites/planets/{u}/{p}', None) for u, p in pairs],
+        'delete_user': [('DELETE', f'/users/{users + n + 1}', None) for n in range(count)]
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_database(name, url, sizes, args):
+    results = {}
+    env = dict(os.environ, DATABASE_URL=url, RESPONSE_CACHE_MAX_ENTRIES='0', FLASK_DEBUG='0')
+    for size in sizes:
+        print(f'{name}: generating {size} rows', flush=True)
+        generate(env, size, args.requests)
+
+        port = free_port()
+        process = start_server(gunicorn_command(port, args.workers, args.threads), port, env)
+        try:
+            warmup = [request for requests in scenarios(size, 20, seed=1).values() for request in requests if request[0] == 'GET']
+            asyncio.run(run_load(port, warmup, args.concurrency))
+
+            results[str(size)] = {}
+            for scenario, requests in scenarios(size, args.requests).items():
+                results[str(size)][scenario] = summary = asyncio.run(run_load(port, requests, args.concurrency))
+                print(f'{name} {size:>8} {scenario:<18} {json.dumps(summary)}', flush=True)
+        finally:
+            process.terminate()
+            process.wait()
+    return results
+
+def compare(previous, current):
+    # Throughput and p95 change of every scenario found in both runs
+    for database, sizes in current['results'].items():
+        for size, results in sizes.items():
+            for scenario, summary in results.items():
+                old = previous['results'].get(database, {}).get(size, {}).get(scenario)
+                if not old or not old.get('requests') or not summary.get('requests'):
+                    continue
+                throughput = (summary['requests_per_second'] / old['requests_per_second'] - 1) * 100
+                p95 = (summary['p95_ms'] / old['p95_ms'] - 1) * 100 if old['p95_ms'] else 0.0
+                print(f'{database} {size:>8} {scenario:<18} req/s {throughput:+6.1f}%  p95 {p95:+6.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route over seeded datasets')
+    parser.add_argument('--sizes', default='1k,100k,1M', help='comma separated catalog sizes, e.g. 1k,100k,1M')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients sending requests at the same time')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--sqlite-path', default='/tmp/benchmark.db', help='SQLite database file')
+    parser.add_argument('--postgres-url', help='also run against this (disposable) PostgreSQL database')
+    parser.add_argument('--output', help='results file, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', help='results file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    databases = {'sqlite': f'sqlite:///{os.path.abspath(args.sqlite_path)}'}
+    if args.postgres_url:
+        databases['postgresql'] = args.postgres_url
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: getattr(args, key) for key in ('requests', 'concurrency', 'workers', 'threads')},
+        'results': {name: run_database(name, url, sizes, args) for name, url in databases.items()}
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
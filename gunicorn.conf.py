@@ -0,0 +1,13 @@
+# gunicorn reads this file from the directory it is started in (see Procfile)
+import os
+
+def on_starting(server):
+    # Tell the app how many workers share the database: the ETag/Last-Modified
+    # counters only see their own worker's writes (see versioning.py)
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+
+def child_exit(server, worker):
+    # Drop the in-flight gauges of a worker that exited from the aggregated /metrics
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
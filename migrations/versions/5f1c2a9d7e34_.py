@@ -0,0 +1,43 @@
+"""unique favorites per user and item
+
+Revision ID: 5f1c2a9d7e34
+Revises: 123234f3ef4f
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1c2a9d7e34'
+down_revision = '123234f3ef4f'
+branch_labels = None
+depends_on = None
+
+ITEM_COLUMNS = ('character_id', 'planet_id', 'species_id', 'vehicle_id')
+
+
+def upgrade():
+    # Remove duplicate favorites first, keeping the oldest row of each (user, item) pair.
+    # The inner select is wrapped in a derived table so MySQL accepts it too.
+    for column in ITEM_COLUMNS:
+        op.execute(
+            f"DELETE FROM favorites WHERE {column} IS NOT NULL AND id NOT IN ("
+            f"SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM favorites "
+            f"WHERE {column} IS NOT NULL GROUP BY user_id, {column}) AS keep)"
+        )
+
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        batch_op.create_index('ix_favorites_user_character', ['user_id', 'character_id'], unique=True)
+        batch_op.create_index('ix_favorites_user_planet', ['user_id', 'planet_id'], unique=True)
+        batch_op.create_index('ix_favorites_user_species', ['user_id', 'species_id'], unique=True)
+        batch_op.create_index('ix_favorites_user_vehicle', ['user_id', 'vehicle_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorites_user_vehicle')
+        batch_op.drop_index('ix_favorites_user_species')
+        batch_op.drop_index('ix_favorites_user_planet')
+        batch_op.drop_index('ix_favorites_user_character')
@@ -0,0 +1,50 @@
+"""cascade favorites deletes from users and catalog items
+
+Revision ID: 9b3e6d0f41a2
+Revises: 5f1c2a9d7e34
+Create Date: 2026-10-17 11:04:09.552871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e6d0f41a2'
+down_revision = '5f1c2a9d7e34'
+branch_labels = None
+depends_on = None
+
+# The original foreign keys were created unnamed: this convention names them
+# when SQLite reflects the table for the batch copy
+NAMING_CONVENTION = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+}
+
+FOREIGN_KEYS = (
+    ('user_id', 'user'),
+    ('character_id', 'characters'),
+    ('planet_id', 'planets'),
+    ('species_id', 'species'),
+    ('vehicle_id', 'vehicles'),
+)
+
+
+def replace_foreign_keys(ondelete):
+    # Reflect the current names: PostgreSQL and MySQL generated their own, SQLite has none
+    inspector = sa.inspect(op.get_bind())
+    current = {fk['constrained_columns'][0]: fk['name'] for fk in inspector.get_foreign_keys('favorites')}
+
+    with op.batch_alter_table('favorites', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        for column, referred_table in FOREIGN_KEYS:
+            name = f'fk_favorites_{column}_{referred_table}'
+            batch_op.drop_constraint(current.get(column) or name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred_table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -0,0 +1,40 @@
+"""index the numeric catalog columns used in filters and sorts
+
+Revision ID: c84a1f27d5b6
+Revises: 9b3e6d0f41a2
+Create Date: 2026-10-17 12:26:53.104417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84a1f27d5b6'
+down_revision = '9b3e6d0f41a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_characters_height'), ['height'], unique=False)
+        batch_op.create_index(batch_op.f('ix_characters_mass'), ['mass'], unique=False)
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planets_population'), ['population'], unique=False)
+
+    with op.batch_alter_table('vehicles', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vehicles_cargo_capacity'), ['cargo_capacity'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vehicles', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_vehicles_cargo_capacity'))
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planets_population'))
+
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_characters_mass'))
+        batch_op.drop_index(batch_op.f('ix_characters_height'))
@@ -0,0 +1,28 @@
+"""rebuild counters of the in-memory catalog stats
+
+Revision ID: e3a7b5c19d08
+Revises: c84a1f27d5b6
+Create Date: 2026-10-17 18:04:12.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7b5c19d08'
+down_revision = 'c84a1f27d5b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stats_epochs',
+    sa.Column('table_name', sa.String(length=80), nullable=False),
+    sa.Column('epoch', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_epochs')
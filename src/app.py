@@ -1,68 +1,204 @@
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import time
+from flask import Flask, Blueprint, current_app, request, jsonify, url_for, Response, stream_with_context
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
+from utils import APIException, generate_sitemap, get_page_args, paginate_rows, get_fields_arg, load_fields, select_fields, rows_to_dicts
+from generator import setup_commands
+from versioning import conditional, table_versions
+from response_cache import response_cache
+from bulk import bulk_import, insert_ignore
+from search import search_index
+from stats import catalog_stats
+from json_provider import FastJSONProvider, list_response
+from pool import engine_options, pool_stats
+from replicas import replica_router, read_replica
+from resources import resources
+from metrics import metrics
+from profiling import sql_profiler
 from models import db, User, Favorites, Characters, Planets, Species, Vehicles
 from datetime import datetime
 import hashlib
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+
+# Every API route is registered on this blueprint, see create_app()
+api = Blueprint('api', __name__)
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+def create_app(admin=None, swagger=None, migrate=None):
+    # Build the app. The admin UI, the /swagger.json spec and the `flask db`
+    # commands are optional: on unless turned off here or with ENABLE_ADMIN,
+    # ENABLE_SWAGGER or ENABLE_MIGRATE=0. flask_admin, flask_swagger and
+    # flask_migrate are only imported when their feature is on, so API-only
+    # workers skip them. The time taken is logged and kept in STARTUP_SECONDS.
+    started = time.perf_counter()
+    admin = env_flag("ENABLE_ADMIN", True) if admin is None else admin
+    swagger = env_flag("ENABLE_SWAGGER", True) if swagger is None else swagger
+    migrate = env_flag("ENABLE_MIGRATE", True) if migrate is None else migrate
+
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.json = FastJSONProvider(app)
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool size, overflow, timeout, recycle and pre-ping from the DATABASE_POOL_* variables
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    # Optional read replicas for the @read_replica views, as a comma separated list of URLs
+    replica_urls = os.getenv("DATABASE_REPLICA_URLS")
+    if replica_urls:
+        replica_router.configure(
+            [url.strip().replace("postgres://", "postgresql://") for url in replica_urls.split(',') if url.strip()],
+            engine_options,
+            max_lag=float(os.getenv("DATABASE_REPLICA_MAX_LAG", 1)),
+            retry_interval=float(os.getenv("DATABASE_REPLICA_RETRY_INTERVAL", 30))
+        )
+        table_versions.subscribe(replica_router.note_write)
 
-#from models import Person
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # In-memory cache for the catalog GET endpoints
+    response_cache.configure(
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000)),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", 60))
+    )
 
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+    db.init_app(app)
+    CORS(app)
+    if migrate:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    if admin:
+        from admin import setup_admin
+        setup_admin(app)
+    if swagger:
+        from flask_swagger import swagger as swagger_spec
+
+        # Swagger spec built from the docstrings of the views
+        @app.route('/swagger.json', methods=['GET'])
+        def get_swagger_spec():
+            return jsonify(swagger_spec(app)), 200
+    setup_commands(app)
+    catalog_stats.init_app(app)
+    metrics.init_app(app)
+    # Opt-in SQL profiling: Server-Timing header and N+1 warnings for every request
+    sql_profiler.init_app(
+        app,
+        enabled=env_flag("SQL_PROFILING", False),
+        repeat_threshold=int(os.getenv("SQL_PROFILING_REPEAT_THRESHOLD", 5))
+    )
+    app.register_blueprint(api)
+
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - started
+    metrics.record_startup(app.config['STARTUP_SECONDS'])
+    app.logger.info('App created in %.1f ms (admin=%s, swagger=%s, migrate=%s)',
+                    app.config['STARTUP_SECONDS'] * 1000, admin, swagger, migrate)
+    return app
+
+# Catalog types served by the generic CRUD routes (see resources.py), with the
+# aggregates /stats keeps for each. The search index covers their text columns.
+resources.register('characters', Characters, 'character', 'Character', 'character_id',
+                   numeric=('height', 'mass', 'birth_year'), groups=('homeworld', 'gender'))
+resources.register('planets', Planets, 'planet', 'Planet', 'planet_id',
+                   numeric=('population', 'diameter', 'surface_water'), groups=('climate', 'terrain'))
+resources.register('species', Species, 'specie', 'Species', 'species_id', write_key='species',
+                   numeric=('average_height', 'average_lifespan'), groups=('classification', 'designation', 'language'))
+resources.register('vehicles', Vehicles, 'vehicle', 'Vehicle', 'vehicle_id',
+                   numeric=('cargo_capacity', 'crew', 'passengers', 'length'), groups=('vehicle_class', 'manufacturer'))
+resources.init_routes(api)
+
+# Catalog tables by their URL name
+CATALOG_MODELS = resources.models()
+
+# Favorite item types and the catalog model each one points to
+FAVORITE_TYPES = {
+    'character': Characters,
+    'planet': Planets,
+    'species': Species,
+    'vehicle': Vehicles
+}
+
+# Favorites relationships returned inline by ?expand=true, and the columns they join on
+EXPAND_RELATIONSHIPS = ('character', 'planet', 'species', 'vehicle')
+EXPAND_COLUMNS = ('character_id', 'planet_id', 'species_id', 'vehicle_id')
+
+# Rows fetched per round trip when streaming whole tables
+EXPORT_BATCH_SIZE = 1000
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
+
+# GET response cache statistics
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+# Connection pool usage of this worker, to size DATABASE_POOL_SIZE
+@api.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    stats = pool_stats(db.engine)
+    if replica_router.engines:
+        stats['replicas'] = [
+            {**health, **pool_stats(engine)}
+            for health, engine in zip(replica_router.health(), replica_router.engines)
+        ]
+    return jsonify(stats), 200
+
+# Request metrics of this worker (or of every worker with PROMETHEUS_MULTIPROC_DIR) in the Prometheus text format
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics need prometheus_client, install it with `pipenv install prometheus-client`'}), 501
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 # GET users and individual users
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@conditional('user')
 def get_users():
+    limit, sort, cursor = get_page_args(('id', 'username'))
+    fields = get_fields_arg(User)
     try:
-        users = User.query.all()
+        # Read-only page of row tuples, mapped straight to dicts without ORM objects
+        statement, names = select_fields(User, fields, sort.lstrip('-'))
+        users, next_url = paginate_rows(db.session, statement, User, limit, sort, cursor)
         if not users:
             return jsonify({'error': 'No users found'}), 404
         
-        serialized_users = [user.serialize() for user in users]
+        serialized_users = rows_to_dicts(names, users)
 
-        response_body = {
-            "users": serialized_users
-        }
-
-        return jsonify(response_body), 200
+        return list_response("users", serialized_users, next=next_url), 200
 
     except Exception as e:
         return jsonify({'error': 'Failed to retrieve users', 'details': str(e)}), 500
 
-@app.route('/users/<int:user_id>', methods=['GET'])
+@api.route('/users/<int:user_id>', methods=['GET'])
+@conditional('user')
 def get_user(user_id):
+    fields = get_fields_arg(User)
     try:
-        user = User.query.get(user_id)
+        user = load_fields(User.query, User, fields).get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        serialized_user = user.serialize()
+        serialized_user = user.to_dict(fields)
 
         response_body = {
             "user": serialized_user
@@ -74,173 +210,138 @@ def get_user(user_id):
         return jsonify({'error': 'Failed to retrieve user', 'details': str(e)}), 500
 
 
-# GET complete elements groups or single elements
-@app.route('/characters', methods=['GET'])
-def get_characters():
-    try:
-        # Retrieve all characters from the database
-        characters = Characters.query.all()
-        
-        # Check if characters were found
-        if not characters:
-            # Return a 404 error if no characters were found
-            return jsonify({'error': 'No characters found'}), 404
-        
-        # Serialize the characters
-        serialized_characters = [character.serialize() for character in characters]
-
-        # Create the response body with the serialized characters
-        response_body = {
-            "characters": serialized_characters
-        }
-
-        # Return the response with a 200 status code
-        return jsonify(response_body), 200
+# GET full-text search across the catalogs
+@api.route('/search', methods=['GET'])
+@conditional('characters', 'planets', 'species', 'vehicles')
+@read_replica
+def search_catalog():
+    text = request.args.get('q', '').strip()
+    if not text:
+        raise APIException('Query parameter q is required', status_code=400)
 
-    except Exception as e:
-        # Return a 500 error if an exception occurs while retrieving characters
-        return jsonify({'error': 'Failed to retrieve characters', 'details': str(e)}), 500
+    tables = None
+    if request.args.get('types'):
+        tables = {name.strip() for name in request.args['types'].split(',')}
+        unknown = tables - set(CATALOG_MODELS)
+        if unknown:
+            raise APIException(f'Unknown type(s): {", ".join(sorted(unknown))}', status_code=400)
 
-@app.route('/characters/<int:id>', methods=['GET'])
-def get_character(id):
+    limit, _, _ = get_page_args(('id',))
     try:
-        # Retrieve the character with the specified ID from the database
-        character = Characters.query.get(id)
-        
-        # Check if the character was found
-        if not character:
-            # Return a 404 error if the character was not found
-            return jsonify({'error': 'Character not found'}), 404
-        
-        # Serialize the character
-        serialized_character = character.serialize()
-
-        # Create the response body with the serialized character
-        response_body = {
-            "character": serialized_character
-        }
-
-        # Return the response with a 200 status code
-        return jsonify(response_body), 200
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        raise APIException('Offset must be an integer', status_code=400)
+    if offset < 0:
+        raise APIException('Offset must not be negative', status_code=400)
 
-    except Exception as e:
-        # Return a 500 error if an exception occurs while retrieving the character
-        return jsonify({'error': 'Failed to retrieve character', 'details': str(e)}), 500
+    # The index is built in the background when the server starts
+    if search_index.missing(tables):
+        raise APIException('The search index is still being built, retry shortly', status_code=503)
 
-@app.route('/planets', methods=['GET'])
-def get_planets():
     try:
-        planets = Planets.query.all()
-        if not planets:
-            return jsonify({'error': 'No planets found'}), 404
-        
-        serialized_planets = [planet.serialize() for planet in planets]
+        total, page = search_index.search(text, tables=tables, limit=limit, offset=offset)
 
-        response_body = {
-            "planets": serialized_planets
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to retrieve planets', 'details': str(e)}), 500
-
-@app.route('/planets/<int:id>', methods=['GET'])
-def get_planet(id):
-    try:
-        planet = Planets.query.get(id)
-        if not planet:
-            return jsonify({'error': 'Planet not found'}), 404
-        
-        serialized_planet = planet.serialize()
+        next_url = None
+        if offset + limit < total:
+            next_url = url_for('.search_catalog', **{**request.args.to_dict(), 'offset': offset + limit})
 
         response_body = {
-            "planet": serialized_planet
+            "results": [{"type": table, "id": item_id, "name": name, "score": score} for score, table, item_id, name in page],
+            "total": total,
+            "next": next_url
         }
 
         return jsonify(response_body), 200
 
     except Exception as e:
-        return jsonify({'error': 'Failed to retrieve planet', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to search', 'details': str(e)}), 500
 
-@app.route('/species', methods=['GET'])
-def get_species():
+# GET catalog statistics, maintained incrementally by the write handlers
+@api.route('/stats', methods=['GET'])
+@read_replica
+def get_stats():
     try:
-        species = Species.query.all()
-        if not species:
-            return jsonify({'error': 'No species found'}), 404
-        
-        serialized_species = [specie.serialize() for specie in species]
-
-        response_body = {
-            "species": serialized_species
-        }
-
+        catalog_stats.sync()
+        response_body = {name: catalog_stats.summary(model.__tablename__) for name, model in CATALOG_MODELS.items()}
         return jsonify(response_body), 200
 
     except Exception as e:
-        return jsonify({'error': 'Failed to retrieve species', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to retrieve stats', 'details': str(e)}), 500
 
-@app.route('/species/<int:id>', methods=['GET'])
-def get_onespecies(id):
+@api.route('/stats/<string:name>', methods=['GET'])
+@read_replica
+def get_catalog_stats(name):
+    resource = resources.get(name)
     try:
-        specie = Species.query.get(id)
-        if not specie:
-            return jsonify({'error': 'Species not found'}), 404
-        
-        serialized_specie = specie.serialize()
-
-        response_body = {
-            "specie": serialized_specie
-        }
-
-        return jsonify(response_body), 200
+        catalog_stats.sync()
+        return jsonify({name: catalog_stats.summary(resource.table)}), 200
 
     except Exception as e:
-        return jsonify({'error': 'Failed to retrieve specie', 'details': str(e)}), 500
+        return jsonify({'error': f'Failed to retrieve {name} stats', 'details': str(e)}), 500
 
-@app.route('/vehicles', methods=['GET'])
-def get_vehicles():
+# POST recompute every aggregate from the database, e.g. after changes made outside
+# the API. Every worker rebuilds on its next read, like with `flask rebuild-stats`.
+@api.route('/stats/rebuild', methods=['POST'])
+def rebuild_stats():
     try:
-        vehicles = Vehicles.query.all()
-        if not vehicles:
-            return jsonify({'error': 'No vehicles found'}), 404
-        
-        serialized_vehicles = [vehicle.serialize() for vehicle in vehicles]
-
-        response_body = {
-            "vehicles": serialized_vehicles
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to retrieve vehicles', 'details': str(e)}), 500
-
-@app.route('/vehicles/<int:id>', methods=['GET'])
-def get_vehicle(id):
-    try:
-        vehicle = Vehicles.query.get(id)
-        if not vehicle:
-            return jsonify({'error': 'Vehicle not found'}), 404
-        
-        serialized_vehicle = vehicle.serialize()
-
-        response_body = {
-            "vehicle": serialized_vehicle
-        }
-
-        return jsonify(response_body), 200
+        catalog_stats.rebuild()
+        return jsonify({"success": "Stats rebuilt successfully"}), 200
 
     except Exception as e:
-        return jsonify({'error': 'Failed to retrieve vehicle', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to rebuild stats', 'details': str(e)}), 500
+
+# GET streamed exports of whole catalog tables
+def export_rows(resource, fields):
+    # Iterate the table in primary key order as row tuples, EXPORT_BATCH_SIZE rows
+    # per fetch, so only one batch is alive at a time and no ORM objects are built
+    statement, names = select_fields(resource.model, fields)
+    statement = statement.order_by(resource.model.__table__.c.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for row in db.session.execute(statement):
+        yield current_app.json.dumps(dict(zip(names, row)))
+
+@api.route('/export/<string:name>.ndjson', methods=['GET'])
+@read_replica
+def export_ndjson(name):
+    resource = resources.get(name)
+    fields = get_fields_arg(resource.model)
+
+    def generate():
+        for line in export_rows(resource, fields):
+            yield line + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api.route('/export/<string:name>.json', methods=['GET'])
+@read_replica
+def export_json(name):
+    resource = resources.get(name)
+    fields = get_fields_arg(resource.model)
+
+    def generate():
+        # Send the opening bracket right away, then one row per chunk
+        yield '['
+        separator = ''
+        for line in export_rows(resource, fields):
+            yield separator + line
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 # GET favorites
-@app.route('/users/favorites/<int:user_id>', methods=['GET'])
+@api.route('/users/favorites/<int:user_id>', methods=['GET'])
+@conditional('favorites', 'characters', 'planets', 'species', 'vehicles')
 def get_user_favorites(user_id):
+    fields = get_fields_arg(Favorites)
+    # ?expand=true returns the favorite items inline instead of bare IDs
+    expand = request.args.get('expand', 'false').lower() in ('1', 'true', 'yes')
     try:
         # Retrieve favorites associated with the specified user ID from the database
-        favorites = Favorites.query.filter_by(user_id=user_id).all()
+        query = load_fields(Favorites.query, Favorites, fields, *EXPAND_COLUMNS if expand else ())
+        if expand:
+            # Load the related items with one IN query per relationship, however many favorites there are
+            query = query.options(*[selectinload(getattr(Favorites, relationship)) for relationship in EXPAND_RELATIONSHIPS])
+        favorites = query.filter_by(user_id=user_id).all()
         
         # Check if any favorites were found
         if not favorites:
@@ -248,7 +349,10 @@ def get_user_favorites(user_id):
             return jsonify({'error': 'No favorites found for this user'}), 404
         
         # Serialize the favorites
-        serialized_favorites = [favorite.serialize() for favorite in favorites]
+        if expand:
+            serialized_favorites = [favorite.serialize_expanded(fields) for favorite in favorites]
+        else:
+            serialized_favorites = [favorite.to_dict(fields) for favorite in favorites]
 
         # Create the response body with the serialized favorites
         response_body = {
@@ -264,7 +368,7 @@ def get_user_favorites(user_id):
 
 
 # POST user
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 def create_user():
     data = request.json
 
@@ -313,7 +417,17 @@ def create_user():
     return jsonify(response_body), 201
 
 # POST favorites 
-@app.route('/favorites/characters/<int:user_id>/<int:character_id>', methods=['POST'])
+def add_favorite(user_id, item_type, item_id):
+    # Insert-or-ignore: returns False when the favorite already exists
+    result = db.session.execute(insert_ignore(Favorites.__table__), {'user_id': user_id, f'{item_type}_id': item_id})
+    db.session.commit()
+    if not result.rowcount:
+        return False
+    # Core statements skip the ORM flush hooks
+    table_versions.bump('favorites')
+    return True
+
+@api.route('/favorites/characters/<int:user_id>/<int:character_id>', methods=['POST'])
 def post_favorite_character(user_id, character_id):
     try:
         # Check if the user exists
@@ -326,13 +440,9 @@ def post_favorite_character(user_id, character_id):
         if not character:
             return jsonify({'error': f'Character with ID {character_id} not found'}), 404
 
-        # Create a new entry in the database for the favorite
-        new_favorite = Favorites(
-            user_id=user_id,
-            character_id=character_id
-        )
-        db.session.add(new_favorite)
-        db.session.commit()
+        # Insert the favorite, unless the user already has it (unique user/item index)
+        if not add_favorite(user_id, 'character', character_id):
+            return jsonify({"msg": f"Character with ID {character_id} is already a favorite for user with ID {user_id}"}), 200
 
         response_body = {
             "msg": f"Character with ID {character_id} added to favorites for user with ID {user_id}"
@@ -343,7 +453,7 @@ def post_favorite_character(user_id, character_id):
     except Exception as e:
         return jsonify({'error': 'Failed to add favorite character', 'details': str(e)}), 500
 
-@app.route('/favorites/planets/<int:user_id>/<int:planet_id>', methods=['POST'])
+@api.route('/favorites/planets/<int:user_id>/<int:planet_id>', methods=['POST'])
 def post_favorite_planet(user_id, planet_id):
     try:
         # Check if the user exists
@@ -356,13 +466,9 @@ def post_favorite_planet(user_id, planet_id):
         if not planet:
             return jsonify({'error': f'Planet with ID {planet_id} not found'}), 404
 
-        # Create a new entry in the database for the favorite
-        new_favorite = Favorites(
-            user_id=user_id,
-            planet_id=planet_id
-        )
-        db.session.add(new_favorite)
-        db.session.commit()
+        # Insert the favorite, unless the user already has it (unique user/item index)
+        if not add_favorite(user_id, 'planet', planet_id):
+            return jsonify({"msg": f"Planet with ID {planet_id} is already a favorite for user with ID {user_id}"}), 200
 
         response_body = {
             "msg": f"Planet with ID {planet_id} added to favorites for user with ID {user_id}"
@@ -373,7 +479,7 @@ def post_favorite_planet(user_id, planet_id):
     except Exception as e:
         return jsonify({'error': 'Failed to add favorite planet', 'details': str(e)}), 500
 
-@app.route('/favorites/species/<int:user_id>/<int:species_id>', methods=['POST'])
+@api.route('/favorites/species/<int:user_id>/<int:species_id>', methods=['POST'])
 def post_favorite_species(user_id, species_id):
     try:
         # Check if the user exists
@@ -386,13 +492,9 @@ def post_favorite_species(user_id, species_id):
         if not species:
             return jsonify({'error': f'Species with ID {species_id} not found'}), 404
 
-        # Create a new entry in the database for the favorite
-        new_favorite = Favorites(
-            user_id=user_id,
-            species_id=species_id
-        )
-        db.session.add(new_favorite)
-        db.session.commit()
+        # Insert the favorite, unless the user already has it (unique user/item index)
+        if not add_favorite(user_id, 'species', species_id):
+            return jsonify({"msg": f"Species with ID {species_id} is already a favorite for user with ID {user_id}"}), 200
 
         response_body = {
             "msg": f"Species with ID {species_id} added to favorites for user with ID {user_id}"
@@ -403,7 +505,7 @@ def post_favorite_species(user_id, species_id):
     except Exception as e:
         return jsonify({'error': 'Failed to add favorite species', 'details': str(e)}), 500
 
-@app.route('/favorites/vehicles/<int:user_id>/<int:vehicle_id>', methods=['POST'])
+@api.route('/favorites/vehicles/<int:user_id>/<int:vehicle_id>', methods=['POST'])
 def post_favorite_vehicle(user_id, vehicle_id):
     try:
         # Check if the user exists
@@ -416,13 +518,9 @@ def post_favorite_vehicle(user_id, vehicle_id):
         if not vehicle:
             return jsonify({'error': f'Vehicle with ID {vehicle_id} not found'}), 404
 
-        # Create a new entry in the database for the favorite
-        new_favorite = Favorites(
-            user_id=user_id,
-            vehicle_id=vehicle_id
-        )
-        db.session.add(new_favorite)
-        db.session.commit()
+        # Insert the favorite, unless the user already has it (unique user/item index)
+        if not add_favorite(user_id, 'vehicle', vehicle_id):
+            return jsonify({"msg": f"Vehicle with ID {vehicle_id} is already a favorite for user with ID {user_id}"}), 200
 
         response_body = {
             "msg": f"Vehicle with ID {vehicle_id} added to favorites for user with ID {user_id}"
@@ -433,6 +531,106 @@ def post_favorite_vehicle(user_id, vehicle_id):
     except Exception as e:
         return jsonify({'error': 'Failed to add favorite vehicle', 'details': str(e)}), 500
 
+# POST a batch of favorite additions and removals in one transaction
+def parse_favorite_operations(data):
+    # Returns {(op, item_type): set(ids)} or raises APIException listing every invalid operation
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise APIException('Operations must be a non empty list', status_code=400)
+
+    grouped = {}
+    errors = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append({'operation': index, 'error': 'Operation must be an object'})
+            continue
+        op = operation.get('op')
+        item_type = operation.get('type')
+        item_id = operation.get('id')
+        if op not in ('add', 'remove'):
+            errors.append({'operation': index, 'error': 'Op must be add or remove'})
+        elif item_type not in FAVORITE_TYPES:
+            errors.append({'operation': index, 'error': f'Type must be one of: {", ".join(FAVORITE_TYPES)}'})
+        elif isinstance(item_id, bool) or not isinstance(item_id, int):
+            errors.append({'operation': index, 'error': 'Id must be an integer'})
+        elif item_id in grouped.get(('remove' if op == 'add' else 'add', item_type), ()):
+            # The batch applies as one set-based write, so an item cannot be both added and removed
+            errors.append({'operation': index, 'error': f'{item_type.capitalize()} {item_id} is both added and removed'})
+        else:
+            grouped.setdefault((op, item_type), set()).add(item_id)
+
+    if errors:
+        raise APIException('Invalid operations', status_code=400, payload={'errors': errors})
+    return grouped
+
+@api.route('/users/<int:user_id>/favorites:batch', methods=['POST'])
+def post_favorites_batch(user_id):
+    grouped = parse_favorite_operations(request.get_json(silent=True))
+    try:
+        # Check if the user exists
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': f'User with ID {user_id} not found'}), 404
+
+        # Check every referenced item with one IN query per type
+        missing = []
+        for item_type, model in FAVORITE_TYPES.items():
+            ids = grouped.get(('add', item_type), set()) | grouped.get(('remove', item_type), set())
+            if not ids:
+                continue
+            found = {row.id for row in db.session.query(model.id).filter(model.id.in_(ids))}
+            missing.extend({'type': item_type, 'id': item_id} for item_id in sorted(ids - found))
+        if missing:
+            return jsonify({'error': 'Some items do not exist', 'missing': missing}), 404
+
+        # Removals: one DELETE over every removed item, whatever its type
+        removals = [getattr(Favorites, f'{item_type}_id').in_(grouped[('remove', item_type)])
+                    for item_type in FAVORITE_TYPES if ('remove', item_type) in grouped]
+        removed = 0
+        if removals:
+            removed = Favorites.query.filter(Favorites.user_id == user_id, or_(*removals)).delete(synchronize_session=False)
+
+        # Additions: one insert-or-ignore executemany of the items that are not
+        # favorites yet. Rows added concurrently by another request are ignored.
+        additions = [getattr(Favorites, f'{item_type}_id').in_(grouped[('add', item_type)])
+                     for item_type in FAVORITE_TYPES if ('add', item_type) in grouped]
+        existing = set()
+        if additions:
+            columns = [getattr(Favorites, f'{item_type}_id') for item_type in FAVORITE_TYPES]
+            for favorite in db.session.query(*columns).filter(Favorites.user_id == user_id, or_(*additions)):
+                existing.update((item_type, item_id) for item_type, item_id in zip(FAVORITE_TYPES, favorite) if item_id is not None)
+        rows = [
+            {'user_id': user_id, **{f'{column}_id': item_id if column == item_type else None for column in FAVORITE_TYPES}}
+            for item_type in FAVORITE_TYPES
+            for item_id in sorted(grouped.get(('add', item_type), ()))
+            if (item_type, item_id) not in existing
+        ]
+        if rows:
+            db.session.execute(insert_ignore(Favorites.__table__), rows)
+
+        # Everything is written in a single transaction
+        db.session.commit()
+
+        # Core statements skip the ORM flush hooks
+        if removed or rows:
+            table_versions.bump('favorites')
+
+        added = len(rows)
+        skipped = sum(len(ids) for ids in grouped.values()) - added - removed
+
+        response_body = {
+            "msg": f"Favorites updated for user with ID {user_id}",
+            "added": added,
+            "removed": removed,
+            "skipped": skipped
+        }
+
+        return jsonify(response_body), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update favorites', 'details': str(e)}), 500
+
 # DELETE favorites
 def delete_favorite(user_id, item_id, item_type):
     try:
@@ -467,400 +665,82 @@ def delete_favorite(user_id, item_id, item_type):
         # Return a 500 error if an exception occurs while deleting the favorite
         return jsonify({'error': f'Failed to delete favorite {item_type}', 'details': str(e)}), 500
 
-@app.route('/favorites/characters/<int:user_id>/<int:character_id>', methods=['DELETE'])
+@api.route('/favorites/characters/<int:user_id>/<int:character_id>', methods=['DELETE'])
 def delete_favorite_character(user_id, character_id):
     return delete_favorite(user_id, character_id, 'character')
 
-@app.route('/favorites/planets/<int:user_id>/<int:planet_id>', methods=['DELETE'])
+@api.route('/favorites/planets/<int:user_id>/<int:planet_id>', methods=['DELETE'])
 def delete_favorite_planet(user_id, planet_id):
     return delete_favorite(user_id, planet_id, 'planet')
 
-@app.route('/favorites/species/<int:user_id>/<int:species_id>', methods=['DELETE'])
+@api.route('/favorites/species/<int:user_id>/<int:species_id>', methods=['DELETE'])
 def delete_favorite_species(user_id, species_id):
     return delete_favorite(user_id, species_id, 'species')
 
-@app.route('/favorites/vehicles/<int:user_id>/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/favorites/vehicles/<int:user_id>/<int:vehicle_id>', methods=['DELETE'])
 def delete_favorite_vehicle(user_id, vehicle_id):
     return delete_favorite(user_id, vehicle_id, 'vehicle')
 
-# POST elements
-@app.route('/characters', methods=['POST'])
-def post_character():
-    try:
-        # Extract data from the request JSON
-        data = request.json
-
-        # Create a new Character object with the provided data
-        new_character = Characters(
-            name=data.get('name'),
-            birth_year=data.get('birth_year'),
-            homeworld=data.get('homeworld'),
-            gender=data.get('gender'),
-            eye_color=data.get('eye_color'),
-            hair_color=data.get('hair_color'),
-            height=data.get('height'),
-            mass=data.get('mass'),
-            skin_color=data.get('skin_color')
-        )
+# POST bulk import of catalog elements (JSON array or NDJSON body)
+@api.route('/import/<string:name>', methods=['POST'])
+def post_bulk_import(name):
+    model = resources.get(name).model
+    upsert = request.args.get('upsert', 'false').lower() in ('1', 'true', 'yes')
 
-        # Add the new character to the database session and commit changes
-        db.session.add(new_character)
-        db.session.commit()
+    result = bulk_import(model, upsert=upsert)
+    if result['written']:
+        search_index.mark_stale(model.__tablename__)
+        catalog_stats.expire(model.__tablename__)
 
-        # Create the response body with success message and serialized character data
-        response_body = {
-            "success": "Character created successfully",
-            "character": new_character.serialize()
-        }
+    # Rows that failed validation or were rejected by the database are listed in errors
+    status_code = 201 if result['written'] or not result['received'] else 400
+    return jsonify(result), status_code
 
-        # Return the response with a 201 status code
-        return jsonify(response_body), 201
 
-    except Exception as e:
-        # Return a 500 error if an exception occurs while creating the character
-        return jsonify({'error': 'Failed to create character', 'details': str(e)}), 500
+# POST batch delete of catalog elements by id, e.g. /characters:batchDelete
+@api.route('/<string:name>:batchDelete', methods=['POST'])
+def post_batch_delete(name):
+    resource = resources.get(name)
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids or any(isinstance(item_id, bool) or not isinstance(item_id, int) for item_id in ids):
+        raise APIException('Ids must be a non empty list of integers', status_code=400)
 
-@app.route('/planets', methods=['POST'])
-def post_planet():
     try:
-        data = request.json
-
-        new_planet = Planets(
-            name=data.get('name'),
-            climate=data.get('climate'),
-            population=data.get('population'),
-            terrain=data.get('terrain'),
-            diameter=data.get('diameter'),
-            surface_water=data.get('surface_water'),
-            gravity=data.get('gravity'),
-            rotation_period=data.get('rotation_period'),
-            orbital_period=data.get('orbital_period')
-        )
-
-        db.session.add(new_planet)
-        db.session.commit()
+        # Delete them all with the same statements as a single delete
+        found = resource.delete(ids)
 
         response_body = {
-            "success": "Planet created successfully",
-            "planet": new_planet.serialize()
-        }
-
-        return jsonify(response_body), 201
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to create planet', 'details': str(e)}), 500
-
-@app.route('/species', methods=['POST'])
-def post_species():
-    try:
-        data = request.json
-
-        new_species = Species(
-            name=data.get('name'),
-            classification=data.get('classification'),
-            designation=data.get('designation'),
-            language=data.get('language'),
-            average_height=data.get('average_height'),
-            average_lifespan=data.get('average_lifespan'),
-            eye_colors=data.get('eye_colors'),
-            hair_colors=data.get('hair_colors'),
-            skin_colors=data.get('skin_colors')
-        )
-
-        db.session.add(new_species)
-        db.session.commit()
-
-        response_body = {
-            "success": "Species created successfully",
-            "species": new_species.serialize()
-        }
-
-        return jsonify(response_body), 201
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to create species', 'details': str(e)}), 500
-
-@app.route('/vehicles', methods=['POST'])
-def post_vehicles():
-    try:
-        data = request.json
-
-        new_vehicle = Vehicles(
-            id=data.get('id'),
-            name=data.get('name'),
-            model=data.get('model'),
-            vehicle_class=data.get('vehicle_class'),
-            consumables=data.get('consumables'),
-            length=data.get('length'),  
-            max_atmosphering_speed=data.get('max_atmosphering_speed'),
-            cargo_capacity=data.get('cargo_capacity'),
-            crew=data.get('crew'),
-            passengers=data.get('passengers'),
-            manufacturer=data.get('manufacturer')
-        )
-
-        db.session.add(new_vehicle)
-        db.session.commit()
-
-        response_body = {
-            "success": "Vehicle created successfully",
-            "vehicle": new_vehicle.serialize()
-        }
-
-        return jsonify(response_body), 201
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to create vehicle', 'details': str(e)}), 500
-
-
-# PUT elements (modify)
-@app.route('/characters/<int:id>', methods=['PUT'])
-def put_character(id):
-    try:
-        # Extract data from the request JSON
-        data = request.json
-        
-        # Query the database to find the character with the provided ID
-        character = Characters.query.get(id)
-        
-        # Check if the character exists
-        if character is None:
-            return jsonify({'error': f'Character with ID {id} not found'}), 404
-        
-        # Update the character attributes with the provided data
-        character.name = data.get('name')
-        character.birth_year = data.get('birth_year')
-        character.homeworld = data.get('homeworld')
-        character.gender = data.get('gender')
-        character.eye_color = data.get('eye_color')
-        character.hair_color = data.get('hair_color')
-        character.height = data.get('height')
-        character.mass = data.get('mass')
-        character.skin_color = data.get('skin_color')
-        
-        # Commit the changes to the database
-        db.session.commit()
-
-        # Create the response body with success message and serialized character data
-        response_body = {
-            "success": f"Character with ID {id} updated successfully",
-            "character": character.serialize()
-        }
-
-        # Return the response with a 200 status code
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        # Return a 500 error if an exception occurs while updating the character
-        return jsonify({'error': 'Failed to update character', 'details': str(e)}), 500
-
-@app.route('/planets/<int:id>', methods=['PUT'])
-def put_planet(id):
-    try:
-        data = request.json
-        
-        planet = Planets.query.get(id)
-        
-        if planet is None:
-            return jsonify({'error': f'Planet with ID {id} not found'}), 404
-        
-        planet.name = data.get('name')
-        planet.climate = data.get('climate')
-        planet.population = data.get('population')
-        planet.terrain = data.get('terrain')
-        planet.diameter = data.get('diameter')
-        planet.gravity = data.get('gravity')
-        planet.rotation_period = data.get('rotation_period')
-        planet.orbital_period = data.get('orbital_period')
-        
-        db.session.commit()
-
-        response_body = {
-            "success": f"Planet with ID {id} updated successfully",
-            "planet": planet.serialize()
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to update planet', 'details': str(e)}), 500
-
-@app.route('/species/<int:id>', methods=['PUT'])
-def put_species(id):
-    try:
-        data = request.json
-        
-        specie = Species.query.get(id)
-        
-        if specie is None:
-            return jsonify({'error': f'Species with ID {id} not found'}), 404
-        
-        specie.name = data.get('name')
-        specie.classification = data.get('classification')
-        specie.designation = data.get('designation')
-        specie.language = data.get('language')
-        specie.average_height = data.get('average_height')
-        specie.average_lifespan = data.get('average_lifespan')
-        specie.eye_colors = data.get('eye_colors')
-        specie.hair_colors = data.get('hair_colors')
-        specie.skin_colors = data.get('skin_colors')
-        
-        db.session.commit()
-
-        response_body = {
-            "success": f"Species with ID {id} updated successfully",
-            "species": specie.serialize()
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to update species', 'details': str(e)}), 500
-
-@app.route('/vehicles/<int:id>', methods=['PUT'])
-def put_vehicle(id):
-    try:
-        data = request.json
-        
-        vehicle = Vehicles.query.get(id)
-        
-        if vehicle is None:
-            return jsonify({'error': f'Vehicle with ID {id} not found'}), 404
-        
-        vehicle.name = data.get('name')
-        vehicle.model = data.get('model')
-        vehicle.vehicle_class = data.get('vehicle_class')
-        vehicle.manufacturer = data.get('manufacturer')
-        vehicle.cost_in_credits = data.get('cost_in_credits')
-        vehicle.length = data.get('length')
-        vehicle.max_atmosphering_speed = data.get('max_atmosphering_speed')
-        vehicle.crew = data.get('crew')
-        vehicle.passengers = data.get('passengers')
-        vehicle.cargo_capacity = data.get('cargo_capacity')
-        vehicle.consumables = data.get('consumables')
-        
-        db.session.commit()
-
-        response_body = {
-            "success": f"Vehicle with ID {id} updated successfully",
-            "vehicle": vehicle.serialize()
+            "deleted": sorted(found),
+            "missing": sorted(set(ids) - found)
         }
 
         return jsonify(response_body), 200
 
     except Exception as e:
-        return jsonify({'error': 'Failed to update vehicle', 'details': str(e)}), 500
+        db.session.rollback()
+        return jsonify({'error': f'Failed to delete {name}', 'details': str(e)}), 500
 
 
-# DELETE elements
-@app.route('/characters/<int:id>', methods=['DELETE'])
-def delete_character(id):
-    try:
-        # Query the database to find the character with the provided ID
-        character = Characters.query.get(id)
-        
-        # Check if the character exists
-        if character is None:
-            return jsonify({'error': f'Character with ID {id} not found'}), 404
-        
-        # Delete the character from the database
-        db.session.delete(character)
-        db.session.commit()
-
-        # Create the response body with success message
-        response_body = {
-            "success": f"Character with ID {id} deleted successfully"
-        }
-
-        # Return the response with a 200 status code
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        # Return a 500 error if an exception occurs while deleting the character
-        return jsonify({'error': 'Failed to delete character', 'details': str(e)}), 500
-
-@app.route('/planets/<int:id>', methods=['DELETE'])
-def delete_planet(id):
-    try:
-        planet = Planets.query.get(id)
-        
-        if planet is None:
-            return jsonify({'error': f'Planet with ID {id} not found'}), 404
-        
-        db.session.delete(planet)
-        db.session.commit()
-
-        response_body = {
-            "success": f"Planet with ID {id} deleted successfully"
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to delete planet', 'details': str(e)}), 500
-
-@app.route('/species/<int:id>', methods=['DELETE'])
-def delete_species(id):
+# DELETE user
+@api.route('/users/<int:user_id>', methods=['DELETE'])
+def delete_user(user_id):
     try:
-        specie = Species.query.get(id)
-        
-        if specie is None:
-            return jsonify({'error': f'Species with ID {id} not found'}), 404
-        
-        db.session.delete(specie)
-        db.session.commit()
-
-        response_body = {
-            "success": f"Species with ID {id} deleted successfully"
-        }
+        # Delete all favorites associated with the user in one statement
+        Favorites.query.filter_by(user_id=user_id).delete(synchronize_session=False)
 
-        return jsonify(response_body), 200
+        # Delete the user from the database
+        deleted = User.query.filter_by(id=user_id).delete(synchronize_session=False)
 
-    except Exception as e:
-        return jsonify({'error': 'Failed to delete species', 'details': str(e)}), 500
+        # Check if the user existed
+        if not deleted:
+            db.session.rollback()
+            return jsonify({'error': f'User with ID {user_id} not found'}), 404
 
-@app.route('/vehicles/<int:id>', methods=['DELETE'])
-def delete_vehicle(id):
-    try:
-        vehicle = Vehicles.query.get(id)
-        
-        if vehicle is None:
-            return jsonify({'error': f'Vehicle with ID {id} not found'}), 404
-        
-        db.session.delete(vehicle)
         db.session.commit()
 
-        response_body = {
-            "success": f"Vehicle with ID {id} deleted successfully"
-        }
-
-        return jsonify(response_body), 200
-
-    except Exception as e:
-        return jsonify({'error': 'Failed to delete vehicle', 'details': str(e)}), 500
-
-
-# DELETE user
-@app.route('/users/<int:user_id>', methods=['DELETE'])
-def delete_user(user_id):
-    try:
-        # Query the database to find the user with the provided ID
-        user = User.query.get(user_id)
-        
-        # Check if the user exists
-        if user is None:
-            return jsonify({'error': f'User with ID {user_id} not found'}), 404
-        
-        # Get all favorites associated with the user
-        user_favorites = Favorites.query.filter_by(user_id=user_id).all()
-        
-        # Delete user favorites
-        for favorite in user_favorites:
-            db.session.delete(favorite)
-        
-        # Delete the user from the database
-        db.session.delete(user)
-        db.session.commit()
+        # Bulk statements skip the ORM flush hooks
+        table_versions.bump('user', 'favorites', rows={('user', user_id)})
 
         # Create the response body with success message
         response_body = {
@@ -872,6 +752,7 @@ def delete_user(user_id):
 
     except Exception as e:
         # Return a 500 error if an exception occurs while deleting the user
+        db.session.rollback()
         return jsonify({'error': 'Failed to delete user', 'details': str(e)}), 500
 
 
@@ -879,4 +760,6 @@ def delete_user(user_id):
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
+    app = create_app()
+    search_index.start_build(app)
     app.run(host='0.0.0.0', port=PORT, debug=False)
\ No newline at end of file
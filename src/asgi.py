@@ -0,0 +1,297 @@
+# ASGI entry point, an alternative to wsgi.py for high concurrency deployments:
+#
+#   uvicorn asgi:application --app-dir src --port 3000
+#
+# For several workers set WEB_CONCURRENCY=4 rather than --workers 4: uvicorn takes
+# it as the worker count and the app then knows not to answer conditional GETs
+# from its per-process counters (see versioning.py).
+#
+# The catalog and users GET routes are served by async handlers over an async
+# SQLAlchemy engine, so one process keeps thousands of requests in flight while
+# they wait on the database. Their reads go to the DATABASE_REPLICA_URLS replicas
+# like the @read_replica views do (see replicas.py). They share the response
+# cache, compression, /metrics and SQL profiling of the Flask app, which serves
+# every other route in a thread pool. Needs uvicorn and asgiref (see the
+# Pipfile) plus the async driver of the database: asyncpg (PostgreSQL), aiosqlite
+# (SQLite) or aiomysql.
+
+import re
+import time
+from urllib.parse import parse_qsl, urlencode
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import http_date, parse_date, parse_etags
+from app import create_app
+from resources import resources
+from models import User
+from utils import APIException, get_page_args, get_fields_arg, get_filter_args, load_fields, select_fields, rows_to_dicts, keyset, next_cursor
+from response_cache import response_cache
+from versioning import table_versions, not_modified_since, last_modified_header
+from pool import pool_options
+from replicas import replica_router
+from search import search_index
+from compression import CompressionMiddleware
+from metrics import metrics
+from profiling import sql_profiler, recording
+
+# Serves every route the async handlers below do not, compressed like in wsgi.py
+app = create_app(migrate=False)
+app.wsgi_app = CompressionMiddleware.from_env(app.wsgi_app, variant_cache=response_cache)
+compression = app.wsgi_app
+
+# Async drivers for the URLs DATABASE_URL can hold
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mysql+mysqlconnector': 'mysql+aiomysql'
+}
+
+def async_database_url(url):
+    scheme, separator, rest = url.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+engine = create_async_engine(
+    async_database_url(app.config['SQLALCHEMY_DATABASE_URI']),
+    **pool_options(app.config['SQLALCHEMY_DATABASE_URI'])
+)
+AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
+
+# Async engines of the DATABASE_REPLICA_URLS replicas, keyed by the sync engine
+# replica_router picks, so the async reads follow the same round robin, lag and
+# health rules as the @read_replica Flask views
+replica_engines = {}
+for replica in replica_router.engines:
+    replica_url = replica.url.render_as_string(hide_password=False)
+    replica_engines[replica] = create_async_engine(async_database_url(replica_url), **pool_options(replica_url))
+
+def replica_failure(error):
+    # Same errors as ReplicaRouter._handle_error: the replica is down, not the query wrong
+    return isinstance(error, exc.OperationalError) or (isinstance(error, exc.DBAPIError) and error.connection_invalidated)
+
+async def read(request, statement, consume):
+    # Run a read on the replica replica_router chooses, or on the primary. A replica
+    # failing is marked down and the read runs again on the primary.
+    # consume(result) extracts the rows while the session is open. Sets
+    # request.from_replica when the replica answered, see served_by_replica().
+    replica = replica_router.choose()
+    if replica is not None:
+        try:
+            async with AsyncSession(bind=replica_engines[replica]) as session:
+                result = consume(await session.execute(statement))
+                request.from_replica = True
+                return result
+        except exc.DBAPIError as error:
+            if not replica_failure(error):
+                raise
+            replica_router.mark_down(replica)
+    async with AsyncSession() as session:
+        return consume(await session.execute(statement))
+
+# URL name -> (model, key of a single item in the response, label used in 404 messages)
+RESOURCES = {resource.name: (resource.model, resource.key, resource.label) for resource in resources}
+RESOURCES['users'] = (User, 'user', 'User')
+
+ROUTE_NAMES = '|'.join(re.escape(name) for name in RESOURCES)
+LIST_ROUTE = re.compile(rf'^/({ROUTE_NAMES})/?$')
+ITEM_ROUTE = re.compile(rf'^/({ROUTE_NAMES})/(\d+)/?$')
+
+# Metrics endpoint labels: the Flask URL rules the async handlers stand in for
+_adapter = app.url_map.bind('localhost')
+ENDPOINTS = {
+    (name, item): _adapter.match(f'/{name}/1' if item else f'/{name}', method='GET', return_rule=True)[0].rule
+    for name in RESOURCES for item in (False, True)
+}
+
+
+class Request:
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.method = scope['method']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        # Same keys as request.full_path and response_cache.cache_key() in the Flask app
+        self.full_path = f'{self.path}?{self.query_string}'
+        self.cache_key = f'{self.path}?{urlencode(sorted(self.args.items(multi=True)))}'
+        self.from_replica = False
+
+    def not_modified(self, etag, last_modified):
+        if 'if-none-match' in self.headers:
+            # Compressed representations carry "-gzip" ETags: compare the ones the app issued
+            return parse_etags(compression.strip_encodings(self.headers['if-none-match'])).contains(etag)
+        if 'if-modified-since' in self.headers:
+            since = parse_date(self.headers['if-modified-since'])
+            return since is not None and not_modified_since(last_modified, since)
+        return False
+
+
+def json_headers(headers=()):
+    return [('content-type', 'application/json'), ('access-control-allow-origin', '*'), *headers]
+
+async def send_response(send, status, body, headers):
+    if not any(name.lower() == 'content-length' for name, _ in headers):
+        headers = [*headers, ('content-length', str(len(body)))]
+    # ASGI header names are lowercase
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def encode(body):
+    return app.json.dumps_bytes(body)
+
+def serializer(name, fields):
+    # The compiled serializer of a catalog type, to_dict() for users
+    if name in resources:
+        return resources.get(name).serializer(fields)
+    return lambda row: row.to_dict(fields)
+
+
+async def list_items(request, name):
+    model, _, _ = RESOURCES[name]
+    if model is User:
+        limit, sort, cursor = get_page_args(('id', 'username'), request.args)
+        filters = []
+    else:
+        limit, sort, cursor = get_page_args(model.field_names(), request.args)
+        filters = get_filter_args(model, request.args)
+    fields = get_fields_arg(model, request.args)
+
+    # Row tuples of the requested columns, mapped straight to dicts like the Flask list views
+    statement, names = select_fields(model, fields, sort.lstrip('-'))
+    rows = await read(request, keyset(statement.where(*filters), model.__table__.c, limit, sort, cursor), lambda result: result.all())
+    rows, after = next_cursor(rows, limit, sort)
+
+    if not rows:
+        return 404, {'error': f'No {name} found'}
+
+    next_url = None
+    if after is not None:
+        args = request.args.to_dict(flat=False)
+        args['after'] = after
+        next_url = f'{request.path}?{urlencode(args, doseq=True)}'
+
+    return 200, {name: rows_to_dicts(names, rows), 'next': next_url}
+
+async def get_item(request, name, item_id):
+    model, key, label = RESOURCES[name]
+    fields = get_fields_arg(model, request.args)
+
+    query = load_fields(select(model).filter(model.id == item_id), model, fields)
+    row = await read(request, query, lambda result: result.scalars().first())
+
+    if row is None:
+        return 404, {'error': f'{label} not found'}
+    return 200, {key: serializer(name, fields)(row)}
+
+
+class AsyncApp:
+    # Routes the hot read paths to the async handlers above, with the same
+    # conditional GET, response cache, compression, metrics and profiling
+    # behaviour as the Flask views, and everything else to the wrapped WSGI app.
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = LIST_ROUTE.match(scope['path'])
+            if match:
+                return await self.serve(scope, send, match.group(1), None)
+            match = ITEM_ROUTE.match(scope['path'])
+            if match:
+                return await self.serve(scope, send, match.group(1), int(match.group(2)))
+
+        return await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Index the catalogs for /search in the background, /search answers 503 until done
+                search_index.start_build(app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                for replica_engine in replica_engines.values():
+                    await replica_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def serve(self, scope, send, name, item_id):
+        # Records the request like the Flask before/after request hooks do
+        request = Request(scope)
+        labels = (request.method, ENDPOINTS[(name, item_id is not None)])
+        started = time.perf_counter()
+        if metrics.enabled:
+            metrics.in_flight.labels(*labels).inc()
+        try:
+            if sql_profiler.enabled:
+                with recording() as recorder:
+                    status, body, headers = await self.handle(request, name, item_id)
+                headers = [*headers, ('server-timing', sql_profiler.report(recorder, request.method, request.path))]
+            else:
+                status, body, headers = await self.handle(request, name, item_id)
+            await send_response(send, status, body, headers)
+        finally:
+            if metrics.enabled:
+                metrics.in_flight.labels(*labels).dec()
+        if metrics.enabled:
+            metrics.observe(labels, status, time.perf_counter() - started, len(body))
+
+    async def handle(self, request, name, item_id):
+        # (status, body, headers) of the response
+        model = RESOURCES[name][0]
+        table = model.__tablename__
+
+        validators = []
+        if table_versions.enabled():
+            etag, last_modified = table_versions.validators((table,), request.full_path)
+            validators = [('etag', f'"{etag}"'), ('cache-control', 'no-cache')]
+            header = last_modified_header(last_modified)
+            if header is not None:
+                validators.append(('last-modified', http_date(header)))
+            if request.not_modified(etag, last_modified):
+                return 304, b'', compression.not_modified_headers(validators, request.headers.get('if-none-match'))
+
+        encoding = compression.negotiate(request.headers.get('accept-encoding', ''))
+
+        # The users routes are not cached by the Flask app either
+        cacheable = model is not User
+        if cacheable:
+            entry = response_cache.get(request.cache_key)
+            if entry is not None:
+                body, headers = compression.encode(encoding, entry['body'], json_headers(validators), request.cache_key)
+                return entry['status'], body, headers
+
+        version = table_versions.get(table)[0]
+        try:
+            if item_id is None:
+                status, body = await list_items(request, name)
+            else:
+                status, body = await get_item(request, name, item_id)
+        except APIException as error:
+            return error.status_code, encode(error.to_dict()), json_headers()
+        except Exception as e:
+            return 500, encode({'error': f'Failed to retrieve {name}', 'details': str(e)}), json_headers()
+
+        body = encode(body)
+        if status != 200:
+            return status, body, json_headers()
+
+        # Like the Flask views: what a replica served is neither stored nor validated
+        if request.from_replica:
+            return (status, *compression.encode(encoding, body, json_headers()))
+        key = None
+        if cacheable and table_versions.get(table)[0] == version:
+            response_cache.set(request.cache_key, (table, item_id), body, status, 'application/json')
+            key = request.cache_key
+        return (status, *compression.encode(encoding, body, json_headers(validators), key))
+
+
+application = AsyncApp(WsgiToAsgi(app))
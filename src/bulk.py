@@ -0,0 +1,149 @@
+from flask import request, current_app
+from sqlalchemy import Integer, String, insert
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException
+from models import db
+from versioning import table_versions
+
+# Rows written per executemany statement and per transaction
+IMPORT_CHUNK_SIZE = 500
+
+def read_rows():
+    # Yield (row number, row) from a JSON array body or an NDJSON stream.
+    # NDJSON is read line by line so large uploads are never held in memory at once.
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        for number, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield number, current_app.json.loads(line)
+            except ValueError:
+                yield number, ValueError('Invalid JSON')
+        return
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise APIException('Expected a JSON array or an application/x-ndjson body', status_code=400)
+    for number, row in enumerate(data, start=1):
+        yield number, row
+
+def import_columns(model):
+    # Writable columns for a bulk import: everything but the autoincrement id
+    return [column for column in model.__table__.columns if column.key != 'id']
+
+def validate_row(columns, row):
+    # Return the row normalized to every column (missing ones become NULL), or raise ValueError
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('Row must be a JSON object')
+
+    names = {column.key for column in columns}
+    unknown = [key for key in row if key not in names]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}')
+
+    values = {}
+    for column in columns:
+        value = row.get(column.key)
+        if value is None:
+            if not column.nullable:
+                raise ValueError(f'{column.key} is required')
+        elif isinstance(column.type, Integer):
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f'{column.key} must be an integer')
+        elif isinstance(column.type, String):
+            if not isinstance(value, str):
+                raise ValueError(f'{column.key} must be a string')
+            if column.type.length is not None and len(value) > column.type.length:
+                raise ValueError(f'{column.key} is longer than {column.type.length} characters')
+        values[column.key] = value
+    return values
+
+def dialect_insert(table):
+    # INSERT construct of the current database, which knows about ON CONFLICT and friends
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        raise APIException(f'Conflict handling is not supported on {dialect}', status_code=400)
+    return dialect, dialect_insert(table)
+
+def insert_ignore(table):
+    # INSERT that silently skips rows violating a unique index
+    dialect, statement = dialect_insert(table)
+    if dialect in ('mysql', 'mariadb'):
+        return statement.prefix_with('IGNORE')
+    return statement.on_conflict_do_nothing()
+
+def insert_statement(model, columns, upsert):
+    table = model.__table__
+    if not upsert:
+        return insert(table)
+
+    # Upsert on the unique name index, overwriting every other column
+    dialect, statement = dialect_insert(table)
+    if dialect in ('mysql', 'mariadb'):
+        return statement.on_duplicate_key_update({column.key: statement.inserted[column.key] for column in columns if column.key != 'name'})
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={column.key: statement.excluded[column.key] for column in columns if column.key != 'name'}
+    )
+
+def write_chunk(statement, chunk, errors):
+    # Write a chunk with one executemany in one transaction. If the database rejects
+    # it, fall back to row by row so a single bad row only costs itself.
+    try:
+        db.session.execute(statement, [values for _, values in chunk])
+        db.session.commit()
+        return len(chunk)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    written = 0
+    for number, values in chunk:
+        try:
+            db.session.execute(statement, [values])
+            db.session.commit()
+            written += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.append({'row': number, 'error': str(e.orig if hasattr(e, 'orig') else e)})
+    return written
+
+def bulk_import(model, upsert=False, chunk_size=IMPORT_CHUNK_SIZE):
+    columns = import_columns(model)
+    statement = insert_statement(model, columns, upsert)
+
+    received = 0
+    written = 0
+    errors = []
+    chunk = []
+    for number, row in read_rows():
+        received += 1
+        try:
+            chunk.append((number, validate_row(columns, row)))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+        if len(chunk) >= chunk_size:
+            written += write_chunk(statement, chunk, errors)
+            chunk = []
+    if chunk:
+        written += write_chunk(statement, chunk, errors)
+
+    # Core statements skip the ORM flush hooks, so invalidate the whole table here
+    if written:
+        table_versions.bump(model.__tablename__)
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'received': received,
+        'written': written,
+        'failed': len(errors),
+        'errors': errors
+    }
@@ -0,0 +1,218 @@
+import gzip
+import os
+import zlib
+
+# brotli and zstandard are optional: each encoding is offered only when its library is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+def parse_accept_encoding(header):
+    # {encoding: q} from an Accept-Encoding header
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+class CompressionMiddleware:
+    # WSGI middleware negotiating br, zstd or gzip from Accept-Encoding.
+    # Buffered responses smaller than min_size, non text content and already
+    # encoded responses pass through untouched; streamed responses are gzipped
+    # chunk by chunk so their first bytes still go out right away.
+    #
+    # Responses served from the app's response cache have their compressed bodies
+    # stored next to the cache entry (variant_cache, see ResponseCache.variant()),
+    # which the app names in environ['response_cache.key']. A repeat request
+    # reuses them instead of compressing again, and they go when the entry goes:
+    # on a write to its table, on expiry or on eviction.
+
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=5, zstd_level=3, variant_cache=None):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.variant_cache = variant_cache
+
+        # Server preference when the client accepts several with the same q
+        self.encodings = []
+        if brotli is not None:
+            self.encodings.append('br')
+        if zstandard is not None:
+            self.encodings.append('zstd')
+        self.encodings.append('gzip')
+
+    def choose_encoding(self, accepted, encodings):
+        best = None
+        for encoding in encodings:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if q > 0 and (best is None or q > best[1]):
+                best = (encoding, q)
+        return best[0] if best else None
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        if encoding == 'zstd':
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(body)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    @classmethod
+    def from_env(cls, app, variant_cache=None):
+        # Settings from the COMPRESSION_* variables, shared by wsgi.py and asgi.py
+        return cls(
+            app,
+            min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 500)),
+            gzip_level=int(os.environ.get('COMPRESSION_LEVEL', 6)),
+            brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5)),
+            zstd_level=int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3)),
+            variant_cache=variant_cache
+        )
+
+    def __call__(self, environ, start_response):
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = self.choose_encoding(accepted, self.encodings)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        # Compressed representations get their own ETag ("abc-gzip"); give the
+        # app back the ETags it issued so conditional requests still match
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = self.strip_encodings(if_none_match)
+
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            # The real start_response is called once we know the encoding
+            return lambda data: None
+
+        result = self.app(environ, capture)
+        status = captured['status']
+        headers = captured['headers']
+        header_names = {name.lower(): value for name, value in headers}
+
+        if status.startswith('304'):
+            start_response(status, self.not_modified_headers(headers, if_none_match), captured['exc_info'])
+            return result
+
+        content_type = header_names.get('content-type', '')
+        if (not status.startswith('200')
+                or 'content-encoding' in header_names
+                or not content_type.startswith(COMPRESSIBLE_TYPES)):
+            start_response(status, headers, captured['exc_info'])
+            return result
+
+        if 'content-length' not in header_names:
+            # Streamed response: gzip as it goes, flushing after every chunk
+            if self.choose_encoding(accepted, ('gzip',)) is None:
+                start_response(status, headers, captured['exc_info'])
+                return result
+            start_response(status, self._headers(headers, 'gzip'), captured['exc_info'])
+            return self._stream_gzip(result)
+
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        body, headers = self.encode(encoding, body, headers, environ.get('response_cache.key'))
+        start_response(status, headers, captured['exc_info'])
+        return [body]
+
+    def encode(self, encoding, body, headers, key=None):
+        # (body, headers) of a buffered 200 response in the chosen encoding, left as
+        # they are when smaller than min_size. key names the response cache entry
+        # holding the body, if any. Also used by the async handlers of asgi.py.
+        if encoding is None or len(body) < self.min_size:
+            return body, headers
+
+        if key is not None and self.variant_cache is not None:
+            compressed = self.variant_cache.variant(key, body, encoding)
+            if compressed is None:
+                compressed = self.compress(body, encoding)
+                self.variant_cache.add_variant(key, body, encoding, compressed)
+        else:
+            compressed = self.compress(body, encoding)
+        return compressed, self._headers(headers, encoding, len(compressed))
+
+    def negotiate(self, accept_encoding):
+        # Encoding for an Accept-Encoding header value, None for identity
+        return self.choose_encoding(parse_accept_encoding(accept_encoding), self.encodings)
+
+    def strip_encodings(self, if_none_match):
+        # If-None-Match with the ETags the app issued, without the "-gzip" suffixes
+        for name in self.encodings:
+            if_none_match = if_none_match.replace(f'-{name}"', '"')
+        return if_none_match
+
+    def _headers(self, headers, encoding, length=None):
+        result = []
+        vary = None
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'etag' and value.endswith('"'):
+                value = f'{value[:-1]}-{encoding}"'
+            if lower == 'vary':
+                vary = value
+                continue
+            result.append((name, value))
+        result.append(('Content-Encoding', encoding))
+        result.append(('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'))
+        if length is not None:
+            result.append(('Content-Length', str(length)))
+        return result
+
+    def not_modified_headers(self, headers, if_none_match):
+        # A 304 repeats the validators of the representation it validates: the
+        # suffixed ETag the client sent back, and Vary since an encoding was negotiated
+        result = []
+        vary = None
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'etag' and if_none_match and value.endswith('"'):
+                for encoding in self.encodings:
+                    if f'{value[:-1]}-{encoding}"' in if_none_match:
+                        value = f'{value[:-1]}-{encoding}"'
+                        break
+            if lower == 'vary':
+                vary = value
+                continue
+            result.append((name, value))
+        result.append(('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'))
+        return result
+
+    def _stream_gzip(self, result):
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        try:
+            for chunk in result:
+                if chunk:
+                    yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
@@ -0,0 +1,286 @@
+import csv
+import hashlib
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import func, insert, select, text
+from models import db, User, Favorites, Characters, Planets, Species, Vehicles
+from stats import catalog_stats
+
+# Synthetic SWAPI-shaped data for load testing:
+#
+#   flask generate --scale 100000 --seed 42 --reset
+#
+# Rows are built as tuples in Python and written in chunks through COPY on
+# PostgreSQL (psycopg2 or psycopg) or DBAPI executemany elsewhere, skipping the
+# ORM entirely. The same seed and counts always produce the same dataset.
+
+GENERATE_CHUNK_SIZE = 10000
+
+CLIMATES = ('arid', 'temperate', 'tropical', 'frozen', 'murky', 'windy', 'hot', 'frigid', 'humid', 'polluted', 'superheated', 'unknown')
+TERRAINS = ('desert', 'grasslands', 'mountains', 'jungle', 'rainforests', 'tundra', 'ice caves', 'swamp', 'gas giant', 'forests', 'cityscape', 'ocean', 'plains', 'volcanoes')
+GRAVITIES = ('1 standard', '0.9 standard', '1.1 standard', '0.5 standard', '1.5 (surface), 1 standard (Cloud City)', 'unknown')
+GENDERS = ('male', 'female', 'n/a', 'hermaphrodite', 'none')
+GENDER_WEIGHTS = (60, 25, 10, 2, 3)
+EYE_COLORS = ('blue', 'yellow', 'red', 'brown', 'blue-gray', 'black', 'orange', 'hazel', 'pink', 'gold', 'green', 'unknown')
+HAIR_COLORS = ('blond', 'none', 'brown', 'brown, grey', 'black', 'auburn, white', 'white', 'grey', 'auburn', 'n/a')
+SKIN_COLORS = ('fair', 'gold', 'white, blue', 'white', 'light', 'green', 'pale', 'metal', 'dark', 'brown', 'grey', 'orange', 'red', 'blue', 'unknown')
+CLASSIFICATIONS = ('mammal', 'artificial', 'sentient', 'gastropod', 'reptile', 'amphibian', 'insectoid', 'reptilian')
+DESIGNATIONS = ('sentient', 'reptilian')
+LANGUAGES = ('Galactic Basic', 'Shyriiwook', 'Huttese', 'Dosh', 'Mon Calamarian', 'Ewokese', 'Sullustese', 'Neimoidia', 'Gungan basic', 'Toydarian', 'Dugese', 'Bothese', 'Tusken')
+VEHICLE_CLASSES = ('wheeled', 'repulsorcraft', 'starfighter', 'airspeeder', 'space/planetary bomber', 'assault walker', 'walker', 'sail barge', 'speeder', 'landing craft', 'submarine', 'gunship', 'transport')
+MANUFACTURERS = ('Corellia Mining Corporation', 'Incom Corporation', 'Sienar Fleet Systems', 'Kuat Drive Yards', 'Aratech Repulsor Company', 'Ubrikkian Industries', 'Bespin Motors', 'SoroSuub Corporation', 'Baktoid Armor Workshop', 'Rothana Heavy Engineering')
+CONSUMABLES = ('none', '1 day', '2 days', '5 days', '1 week', '1 month', '2 months', 'live food tanks', 'unknown')
+SYLLABLES = ('ta', 'too', 'ine', 'na', 'boo', 'dan', 'tu', 'kor', 'ri', 'yav', 'in', 'ho', 'th', 'en', 'dor', 'bes', 'pin', 'kam', 'ino', 'ger', 'on', 'osis', 'man', 'tell', 'ryl', 'oth', 'ul', 'cha', 'ko', 'mus', 'ta', 'far')
+FIRST_NAMES = ('Luke', 'Leia', 'Han', 'Owen', 'Beru', 'Biggs', 'Wedge', 'Jek', 'Lando', 'Mon', 'Padme', 'Anakin', 'Shmi', 'Ben', 'Qui-Gon', 'Mace', 'Ki-Adi', 'Plo', 'Kit', 'Jango', 'Boba', 'Rey', 'Finn', 'Poe')
+LAST_NAMES = ('Skywalker', 'Organa', 'Solo', 'Lars', 'Darklighter', 'Antilles', 'Porkins', 'Calrissian', 'Mothma', 'Amidala', 'Kenobi', 'Jinn', 'Windu', 'Mundi', 'Koon', 'Fisto', 'Fett', 'Dameron', 'Tano', 'Andor')
+
+# Every generated user has this password
+DEFAULT_PASSWORD = 'password'
+
+
+def place_name(rand, number):
+    # "Tatooine 12": invented syllables, numbered so names stay unique
+    return ''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 3))).capitalize() + f' {number}'
+
+def skewed_index(rand, count, skew):
+    # 0..count-1, low indexes far more likely: skew 1 is uniform, higher is more skewed
+    return min(int(count * rand.random() ** skew), count - 1)
+
+
+def planet_rows(rand, first_id, count):
+    for number in range(first_id, first_id + count):
+        yield (number, place_name(rand, number), rand.choice(CLIMATES), rand.randint(0, 2 * 10 ** 9),
+               rand.choice(TERRAINS), rand.randint(0, 200000), rand.randint(0, 100), rand.choice(GRAVITIES),
+               rand.randint(6, 60), rand.randint(100, 5000))
+
+def character_rows(rand, first_id, count, planet_names, skew):
+    for number in range(first_id, first_id + count):
+        # Some planets are far more populated than others
+        homeworld = planet_names[skewed_index(rand, len(planet_names), skew)] if planet_names else None
+        yield (number, f'{rand.choice(FIRST_NAMES)} {rand.choice(LAST_NAMES)} {number}', rand.randint(8, 900), homeworld,
+               rand.choices(GENDERS, GENDER_WEIGHTS)[0], rand.choice(EYE_COLORS), rand.choice(HAIR_COLORS),
+               max(40, int(rand.gauss(175, 30))), max(15, int(rand.gauss(80, 25))), rand.choice(SKIN_COLORS))
+
+def species_rows(rand, first_id, count):
+    for number in range(first_id, first_id + count):
+        yield (number, place_name(rand, number).replace(' ', 'ian ', 1), rand.choice(CLASSIFICATIONS), rand.choice(DESIGNATIONS),
+               rand.choice(LANGUAGES), rand.randint(30, 400), rand.randint(40, 1000), rand.choice(EYE_COLORS),
+               rand.choice(HAIR_COLORS), rand.choice(SKIN_COLORS))
+
+def vehicle_rows(rand, first_id, count):
+    for number in range(first_id, first_id + count):
+        model = f'{rand.choice(SYLLABLES).upper()}-{rand.randint(1, 99)}'
+        yield (number, f'{model} {rand.choice(VEHICLE_CLASSES)} {number}', model, rand.choice(VEHICLE_CLASSES),
+               rand.choice(CONSUMABLES), rand.randint(2, 400), rand.randint(0, 1500), rand.randint(0, 500000),
+               rand.randint(1, 100), rand.randint(0, 500), rand.choice(MANUFACTURERS))
+
+def user_rows(rand, first_id, count):
+    password = hashlib.sha256(DEFAULT_PASSWORD.encode('utf-8')).hexdigest()
+    first_subscription = datetime(2015, 1, 1)
+    for number in range(first_id, first_id + count):
+        first_name, last_name = rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES)
+        yield (number, f'user{number}', f'user{number}@example.com', password, rand.random() < 0.9,
+               first_subscription + timedelta(minutes=rand.randint(0, 5 * 365 * 24 * 60)), first_name, last_name,
+               date(1950, 1, 1) + timedelta(days=rand.randint(0, 50 * 365)))
+
+FAVORITE_ITEM_COLUMNS = ('character_id', 'species_id', 'vehicle_id', 'planet_id')
+
+def favorite_rows(rand, first_id, count, users, items, skew):
+    # users is (first id, count); items maps each favorites column to (first id, count)
+    # of the generated rows. Popular users and items get most favorites; a
+    # (user, item) pair is never repeated, as the unique indexes require. Gives up
+    # after count * 10 draws, so fewer than count rows come out when there are
+    # not enough distinct pairs.
+    columns = [column for column, (_, total) in items.items() if total]
+    if not columns or not users[1]:
+        return
+    seen = set()
+    number = first_id
+    attempts = 0
+    while number < first_id + count and attempts < count * 10:
+        attempts += 1
+        user = users[0] + skewed_index(rand, users[1], skew)
+        column = rand.choice(columns)
+        item = items[column][0] + skewed_index(rand, items[column][1], skew)
+        if (user, column, item) in seen:
+            continue
+        seen.add((user, column, item))
+        yield (number, user, *[item if name == column else None for name in FAVORITE_ITEM_COLUMNS])
+        number += 1
+
+# Column order of the tuples built above
+TABLE_COLUMNS = {
+    Planets: ('id', 'name', 'climate', 'population', 'terrain', 'diameter', 'surface_water', 'gravity', 'rotation_period', 'orbital_period'),
+    Characters: ('id', 'name', 'birth_year', 'homeworld', 'gender', 'eye_color', 'hair_color', 'height', 'mass', 'skin_color'),
+    Species: ('id', 'name', 'classification', 'designation', 'language', 'average_height', 'average_lifespan', 'eye_colors', 'hair_colors', 'skin_colors'),
+    Vehicles: ('id', 'name', 'model', 'vehicle_class', 'consumables', 'length', 'max_atmosphering_speed', 'cargo_capacity', 'crew', 'passengers', 'manufacturer'),
+    User: ('id', 'username', 'email', 'password', 'is_active', 'subscription_date', 'first_name', 'last_name', 'birthdate'),
+    Favorites: ('id', 'user_id', *FAVORITE_ITEM_COLUMNS)
+}
+
+# Deleted in this order by --reset, children first
+RESET_ORDER = (Favorites, Characters, Species, Vehicles, Planets, User)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def copy_rows(connection, table, columns, rows, chunk_size):
+    # PostgreSQL COPY FROM STDIN, one CSV buffer per chunk. Returns False when the
+    # driver has no COPY support so the caller falls back to executemany.
+    driver = connection.connection.driver_connection
+    module = type(driver).__module__
+    statement = f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+
+    if module.startswith('psycopg2'):
+        with driver.cursor() as cursor:
+            for chunk in chunked(rows, chunk_size):
+                buffer = io.StringIO()
+                # NULL is an empty unquoted field; empty strings never occur in the generated data
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(statement, buffer)
+        return True
+    if module.startswith('psycopg'):
+        with driver.cursor() as cursor, cursor.copy(statement.replace('WITH (FORMAT csv)', '')) as copy:
+            for row in rows:
+                copy.write_row(row)
+        return True
+    return False
+
+def counted(rows, counter):
+    # Passes the rows through, counting them in counter['rows']
+    for row in rows:
+        counter['rows'] += 1
+        yield row
+
+def insert_rows(connection, model, rows, chunk_size):
+    table = model.__table__
+    columns = TABLE_COLUMNS[model]
+    if connection.dialect.name == 'postgresql' and copy_rows(connection, table.name, columns, rows, chunk_size):
+        return
+
+    # Plain DBAPI executemany with the dialect's placeholders, converting values
+    # the driver cannot take as they are (e.g. datetimes on SQLite)
+    dialect = connection.dialect
+    compiled = insert(table).compile(dialect=dialect, column_keys=list(columns))
+    processors = [table.c[column].type._cached_bind_processor(dialect) for column in columns]
+    if dialect.positional:
+        order = [columns.index(name) for name in compiled.positiontup]
+        make_params = lambda row: [row[index] for index in order]
+    else:
+        make_params = lambda row: dict(zip(columns, row))
+
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        for chunk in chunked(rows, chunk_size):
+            if any(processors):
+                chunk = [[value if process is None or value is None else process(value) for process, value in zip(processors, row)] for row in chunk]
+            cursor.executemany(str(compiled), [make_params(row) for row in chunk])
+    finally:
+        cursor.close()
+
+def reset_sequences(connection):
+    # Explicit ids leave the PostgreSQL serial sequences behind
+    if connection.dialect.name != 'postgresql':
+        return
+    for model in TABLE_COLUMNS:
+        table = model.__table__.name
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE((SELECT MAX(id) FROM \"{table}\"), 0) + 1, false)"
+        ))
+
+def generate_dataset(counts, seed=0, skew=2.0, reset=False, chunk_size=GENERATE_CHUNK_SIZE, echo=print):
+    # counts maps each model to the number of rows to add. Ids continue after the
+    # existing rows, and the characters and favorites only reference generated rows.
+    # Returns the number of rows actually added per model: fewer favorites than
+    # requested when there are too few distinct (user, item) pairs.
+    rand = random.Random(seed)
+
+    with db.engine.begin() as connection:
+        if reset:
+            for model in RESET_ORDER:
+                connection.execute(model.__table__.delete())
+
+        first_ids = {model: (connection.execute(select(func.max(model.id))).scalar() or 0) + 1 for model in TABLE_COLUMNS}
+        def ids(model):
+            return first_ids[model], counts.get(model, 0)
+
+        # Built up front: every character picks its homeworld from them
+        planets = list(planet_rows(rand, first_ids[Planets], counts.get(Planets, 0)))
+        planet_names = [row[1] for row in planets]
+
+        sources = {
+            Planets: planets,
+            Species: species_rows(rand, *ids(Species)),
+            Vehicles: vehicle_rows(rand, *ids(Vehicles)),
+            Characters: character_rows(rand, *ids(Characters), planet_names, skew),
+            User: user_rows(rand, *ids(User)),
+            Favorites: favorite_rows(rand, *ids(Favorites), ids(User), {
+                'character_id': ids(Characters),
+                'species_id': ids(Species),
+                'vehicle_id': ids(Vehicles),
+                'planet_id': ids(Planets)
+            }, skew)
+        }
+
+        inserted = {}
+        for model, rows in sources.items():
+            if not counts.get(model):
+                continue
+            counter = {'rows': 0}
+            started = time.perf_counter()
+            insert_rows(connection, model, counted(rows, counter), chunk_size)
+            elapsed = time.perf_counter() - started
+            inserted[model] = counter['rows']
+            echo(f'{model.__tablename__}: {inserted[model]} rows in {elapsed:.2f}s ({inserted[model] / elapsed:,.0f} rows/s)')
+            if inserted[model] < counts[model]:
+                # favorite_rows gives up when it keeps drawing (user, item) pairs it already used
+                echo(f'Warning: {model.__tablename__}: only {inserted[model]} of the {counts[model]} rows requested, '
+                     'there are not enough distinct combinations to generate more')
+
+        reset_sequences(connection)
+    return inserted
+
+
+def setup_commands(app):
+    @app.cli.command('generate')
+    @click.option('--scale', type=int, default=1000, help='Rows per catalog table; the other counts derive from it.')
+    @click.option('--characters', type=int, help='Characters to add (default: scale).')
+    @click.option('--planets', type=int, help='Planets to add (default: scale / 2).')
+    @click.option('--species', type=int, help='Species to add (default: scale / 2).')
+    @click.option('--vehicles', type=int, help='Vehicles to add (default: scale / 2).')
+    @click.option('--users', type=int, help='Users to add (default: scale / 10).')
+    @click.option('--favorites', type=int, help='Favorites to add (default: scale).')
+    @click.option('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+    @click.option('--skew', type=float, default=2.0, help='Popularity skew of homeworlds and favorites, 1 is uniform.')
+    @click.option('--reset', is_flag=True, help='Delete every user, favorite and catalog row first.')
+    @click.option('--create-tables', is_flag=True, help='Create missing tables first, for a database without migrations.')
+    def generate(scale, characters, planets, species, vehicles, users, favorites, seed, skew, reset, create_tables):
+        """Generate a synthetic SWAPI-shaped dataset for load testing."""
+        counts = {
+            Characters: scale if characters is None else characters,
+            Planets: max(1, scale // 2) if planets is None else planets,
+            Species: max(1, scale // 2) if species is None else species,
+            Vehicles: max(1, scale // 2) if vehicles is None else vehicles,
+            User: max(1, scale // 10) if users is None else users,
+            Favorites: scale if favorites is None else favorites
+        }
+        if create_tables:
+            db.create_all()
+        started = time.perf_counter()
+        generate_dataset(counts, seed=seed, skew=skew, reset=reset, echo=click.echo)
+        # Running servers rebuild their stats on the next read
+        catalog_stats.expire()
+        click.echo(f'Done in {time.perf_counter() - started:.2f}s. '
+                   'Restart running servers: their caches and search index do not see these rows.')
@@ -0,0 +1,90 @@
+import os
+import time
+from flask import g, request
+
+# prometheus_client is optional: `pipenv install prometheus-client` to collect metrics.
+# With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+# so /metrics aggregates every worker (see gunicorn.conf.py).
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+# Latency buckets in seconds, and response size buckets in bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+class RequestMetrics:
+    # Per-endpoint request count by status, latency and response size histograms
+    # and in-flight gauge, recorded by before/after request hooks. Endpoints are
+    # labelled with their URL rule (/planets/<int:id>), never the raw path, so
+    # the number of series stays bounded.
+
+    def __init__(self):
+        self.enabled = False
+
+    def init_app(self, app):
+        if prometheus_client is None:
+            return
+        # The collectors are process wide: create them once, however many apps are built
+        if not self.enabled:
+            self.create_collectors()
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    def create_collectors(self):
+        self.requests = prometheus_client.Counter(
+            'http_requests_total', 'HTTP requests', ['method', 'endpoint', 'status'])
+        self.latency = prometheus_client.Histogram(
+            'http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+        self.size = prometheus_client.Histogram(
+            'http_response_size_bytes', 'HTTP response body size before compression', ['method', 'endpoint'], buckets=SIZE_BUCKETS)
+        self.in_flight = prometheus_client.Gauge(
+            'http_requests_in_flight', 'HTTP requests being handled', ['method', 'endpoint'], multiprocess_mode='livesum')
+        self.startup = prometheus_client.Gauge(
+            'app_startup_seconds', 'Time create_app() took in this worker', multiprocess_mode='liveall')
+        self.enabled = True
+
+    def record_startup(self, seconds):
+        if self.enabled:
+            self.startup.set(seconds)
+
+    def endpoint(self):
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    def before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_labels = (request.method, self.endpoint())
+        self.in_flight.labels(*g.metrics_labels).inc()
+
+    def after_request(self, response):
+        labels = g.get('metrics_labels')
+        if labels is not None:
+            self.observe(labels, response.status_code, time.perf_counter() - g.metrics_started, response.content_length)
+        return response
+
+    def observe(self, labels, status, seconds, size=None):
+        # One finished request, also called by the async handlers of asgi.py.
+        # Streamed responses have no length up front: size is None.
+        self.latency.labels(*labels).observe(seconds)
+        self.requests.labels(*labels, str(status)).inc()
+        if size is not None:
+            self.size.labels(*labels).observe(size)
+
+    def teardown_request(self, exception=None):
+        labels = g.pop('metrics_labels', None)
+        if labels is not None:
+            self.in_flight.labels(*labels).dec()
+
+    def render(self):
+        # (body, content type) in the Prometheus text format
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+metrics = RequestMetrics()
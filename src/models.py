@@ -1,10 +1,27 @@
 from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSession
 import hashlib
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-class User(db.Model):
+class SerializerMixin:
+    # Columns that must never be sent to the client
+    hidden_fields = ()
+
+    @classmethod
+    def field_names(cls):
+        # Public column names, used to validate ?fields= requests
+        return [column.key for column in cls.__table__.columns if column.key not in cls.hidden_fields]
+
+    def to_dict(self, fields=None):
+        # Full serialization, or only the requested columns for sparse fieldsets
+        if fields is None:
+            return self.serialize()
+        return {field: getattr(self, field) for field in fields}
+
+class User(SerializerMixin, db.Model):
     __tablename__ = 'user'
+    hidden_fields = ('password',)
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(60), index= True, unique=True, nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
@@ -14,7 +31,7 @@ class User(db.Model):
     first_name = db.Column(db.String(60), nullable=False)
     last_name = db.Column(db.String(60), nullable=False)
     birthdate = db.Column(db.Date)
-    favorites = db.relationship("Favorites", back_populates="user")
+    favorites = db.relationship("Favorites", back_populates="user", passive_deletes=True)
 
     def __repr__(self):
         return f'<User id={self.id}, username={self.username}>'
@@ -51,15 +68,22 @@ class User(db.Model):
         # Check if a plain text password matches the hashed password stored
         return self.password == self.hash_password(password)
 
-class Favorites(db.Model):
+class Favorites(SerializerMixin, db.Model):
     __tablename__ = 'favorites'
+    # One favorite per user and item; the indexes also serve the lookups by user_id
+    __table_args__ = (
+        db.Index('ix_favorites_user_character', 'user_id', 'character_id', unique=True),
+        db.Index('ix_favorites_user_planet', 'user_id', 'planet_id', unique=True),
+        db.Index('ix_favorites_user_species', 'user_id', 'species_id', unique=True),
+        db.Index('ix_favorites_user_vehicle', 'user_id', 'vehicle_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     user = db.relationship("User", back_populates="favorites")
-    character_id = db.Column(db.Integer, db.ForeignKey('characters.id'), nullable=True)
-    species_id = db.Column(db.Integer, db.ForeignKey('species.id'), nullable=True)
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=True)
-    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'), nullable=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('characters.id', ondelete='CASCADE'), nullable=True)
+    species_id = db.Column(db.Integer, db.ForeignKey('species.id', ondelete='CASCADE'), nullable=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id', ondelete='CASCADE'), nullable=True)
+    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id', ondelete='CASCADE'), nullable=True)
     character = db.relationship("Characters", back_populates="favorites")
     species = db.relationship("Species", back_populates="favorites")
     vehicle = db.relationship("Vehicles", back_populates="favorites")
@@ -78,8 +102,17 @@ class Favorites(db.Model):
             "planet_id": self.planet_id
         }
 
+    def serialize_expanded(self, fields=None):
+        # Favorite with the related items inline; load them with selectinload() to avoid N+1 queries
+        data = self.to_dict(fields)
+        data["character"] = self.character.serialize() if self.character else None
+        data["planet"] = self.planet.serialize() if self.planet else None
+        data["species"] = self.species.serialize() if self.species else None
+        data["vehicle"] = self.vehicle.serialize() if self.vehicle else None
+        return data
+
 
-class Characters(db.Model):
+class Characters(SerializerMixin, db.Model):
     __tablename__ = 'characters'
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(250), unique=True, index= True, nullable=False)
@@ -88,10 +121,10 @@ class Characters(db.Model):
     gender = db.Column(db.String(250))
     eye_color = db.Column(db.String(250))
     hair_color = db.Column(db.String(250))
-    height = db.Column(db.Integer)
-    mass = db.Column(db.Integer)
+    height = db.Column(db.Integer, index=True)
+    mass = db.Column(db.Integer, index=True)
     skin_color = db.Column(db.String(250))
-    favorites = db.relationship("Favorites", back_populates="character")
+    favorites = db.relationship("Favorites", back_populates="character", passive_deletes=True)
 
     def __repr__(self):
         return f'<Characters id={self.id}, name={self.name}'
@@ -111,19 +144,19 @@ class Characters(db.Model):
         }
     
 
-class Planets(db.Model):
+class Planets(SerializerMixin, db.Model):
     __tablename__ = 'planets'
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(250), unique=True, index= True, nullable=False)
     climate = db.Column(db.String(250), index= True)
-    population = db.Column(db.Integer)
+    population = db.Column(db.Integer, index=True)
     terrain = db.Column(db.String(250))
     diameter = db.Column(db.Integer)
     surface_water = db.Column(db.Integer)
     gravity = db.Column(db.String(250))
     rotation_period = db.Column(db.Integer)
     orbital_period = db.Column(db.Integer)
-    favorites = db.relationship("Favorites", back_populates="planet")
+    favorites = db.relationship("Favorites", back_populates="planet", passive_deletes=True)
 
     def __repr__(self):
         return f'<Planets id={self.id}, name={self.name}'
@@ -144,7 +177,7 @@ class Planets(db.Model):
 
 
 
-class Species(db.Model):
+class Species(SerializerMixin, db.Model):
     __tablename__ = 'species'
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(250), unique=True, index= True, nullable=False)
@@ -156,7 +189,7 @@ class Species(db.Model):
     eye_colors = db.Column(db.String(250))
     hair_colors = db.Column(db.String(250))
     skin_colors = db.Column(db.String(250))
-    favorites = db.relationship("Favorites", back_populates="species")
+    favorites = db.relationship("Favorites", back_populates="species", passive_deletes=True)
 
     def __repr__(self):
         return f'<Species id={self.id}, name={self.name}'
@@ -176,7 +209,7 @@ class Species(db.Model):
         }
 
 
-class Vehicles(db.Model):
+class Vehicles(SerializerMixin, db.Model):
     __tablename__ = 'vehicles'
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(250), unique=True, index= True, nullable=False)
@@ -185,11 +218,11 @@ class Vehicles(db.Model):
     consumables = db.Column(db.String(250))
     length = db.Column(db.Integer)
     max_atmosphering_speed = db.Column(db.Integer)
-    cargo_capacity = db.Column(db.Integer)
+    cargo_capacity = db.Column(db.Integer, index=True)
     crew = db.Column(db.Integer)
     passengers = db.Column(db.Integer)
     manufacturer = db.Column(db.String(250))
-    favorites = db.relationship("Favorites", back_populates="vehicle")
+    favorites = db.relationship("Favorites", back_populates="vehicle", passive_deletes=True)
 
     def __repr__(self):
         return f'<Vehicles id={self.id}, name={self.name}'
@@ -207,4 +240,15 @@ class Vehicles(db.Model):
             "crew": self.crew,
             "passengers": self.passengers,
             "manufacturer": self.manufacturer,
-        }
\ No newline at end of file
+        }
+
+class StatsEpoch(db.Model):
+    # Rebuild counter per catalog table, shared by every process. Rebuilds and bulk
+    # writes bump it, and each worker rebuilds its in-memory /stats aggregates of a
+    # table when it reads a value it has not seen (see stats.py).
+    __tablename__ = 'stats_epochs'
+    table_name = db.Column(db.String(80), primary_key=True)
+    epoch = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatsEpoch table_name={self.table_name}, epoch={self.epoch}'
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+def in_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def pool_options(url, environ=os.environ):
+    # Engine pool settings from the DATABASE_POOL_* environment variables.
+    # Pre-ping and recycling are on by default so connections dropped by a
+    # failover or an idle timeout are replaced instead of failing a request.
+    options = {
+        'pool_pre_ping': environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in TRUE_VALUES,
+        'pool_recycle': int(environ.get('DATABASE_POOL_RECYCLE', 1800))
+    }
+    # In-memory SQLite shares one connection, it has no pool to size
+    if not in_memory_sqlite(url):
+        options['pool_size'] = int(environ.get('DATABASE_POOL_SIZE', 5))
+        options['max_overflow'] = int(environ.get('DATABASE_POOL_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = float(environ.get('DATABASE_POOL_TIMEOUT', 30))
+    return options
+
+def engine_options(url, environ=os.environ):
+    # SQLALCHEMY_ENGINE_OPTIONS: the pool settings plus a pool recording its own stats
+    options = pool_options(url, environ)
+    if 'pool_size' in options:
+        options['poolclass'] = MonitoredQueuePool
+    return options
+
+
+class PoolMonitor:
+    # Counters shared by a pool and the pools recreated from it on dispose()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+class MonitoredQueuePool(QueuePool):
+    # QueuePool that times every checkout, i.e. how long a request waited for a
+    # connection (including opening one and the pre-ping), and counts checkout
+    # timeouts and new connections.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.monitor = PoolMonitor()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.monitor = self.monitor
+        return pool
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.monitor.record_timeout()
+            raise
+        self.monitor.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def _create_connection(self):
+        self.monitor.record_connect()
+        return super()._create_connection()
+
+
+def pool_stats(engine):
+    # Live state of an engine's pool, plus the checkout counters when it records them
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__, 'status': pool.status()}
+
+    stats = {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'timeout': pool.timeout(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        # Negative until the pool has opened pool_size connections
+        'overflow': pool.overflow()
+    }
+    stats['saturation'] = round(stats['checked_out'] / (stats['size'] + max(stats['max_overflow'], 0) or 1), 3)
+
+    monitor = getattr(pool, 'monitor', None)
+    if monitor is not None:
+        with monitor._lock:
+            stats.update({
+                'checkouts': monitor.checkouts,
+                'timeouts': monitor.timeouts,
+                'connects': monitor.connects,
+                'wait_ms_total': round(monitor.wait_total * 1000, 3),
+                'wait_ms_avg': round(monitor.wait_total * 1000 / monitor.checkouts, 3) if monitor.checkouts else 0.0,
+                'wait_ms_max': round(monitor.wait_max * 1000, 3)
+            })
+    return stats
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class QueryRecorder:
+    # Statements run while the recorder is active, with their total time.
+    # SQLAlchemy sends parameterized SQL, so the statement text is its shape:
+    # the same lazy load run for 50 rows shows up 50 times.
+
+    def __init__(self):
+        self.statements = Counter()
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, statement, seconds):
+        self.statements[statement] += 1
+        self.count += 1
+        self.duration += seconds
+
+    def repeated(self, threshold):
+        # [(statement, times)] for the shapes run more than threshold times
+        return [(statement, times) for statement, times in self.statements.most_common() if times > threshold]
+
+# Recorders opened by recording() in the current thread or asyncio task. Other
+# threads, like the search index build, start with an empty context and are not
+# counted.
+_recorders = ContextVar('query_recorders', default=())
+_install_lock = threading.Lock()
+_installed = False
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_started', None)
+    if started is None:
+        # Already running when install() added the listeners
+        return
+    elapsed = time.perf_counter() - started
+    if has_app_context():
+        recorder = g.get('sql_profile')
+        if recorder is not None:
+            recorder.record(statement, elapsed)
+    for recorder in _recorders.get():
+        recorder.record(statement, elapsed)
+
+def install():
+    # Listen on every engine (the primary and the replicas); only done when
+    # profiling is enabled or a query budget is checked, so it costs nothing otherwise
+    global _installed
+    with _install_lock:
+        if not _installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _installed = True
+
+
+class SQLProfiler:
+    # Opt-in per-request SQL profiling: counts the statements of every request and
+    # their time, reports them in a Server-Timing header (visible in the browser
+    # devtools) and logs a warning when one statement shape runs more than
+    # repeat_threshold times in a request, the signature of an N+1 query.
+
+    def __init__(self):
+        self.enabled = False
+        self.repeat_threshold = 5
+
+    def init_app(self, app, enabled=False, repeat_threshold=None):
+        if repeat_threshold is not None:
+            self.repeat_threshold = repeat_threshold
+        if not enabled:
+            return
+        install()
+        self.enabled = True
+        self.logger = app.logger
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        g.sql_profile = QueryRecorder()
+
+    def after_request(self, response):
+        recorder = g.pop('sql_profile', None)
+        if recorder is None:
+            return response
+        response.headers.add('Server-Timing', self.report(recorder, request.method, request.path))
+        return response
+
+    def report(self, recorder, method, path):
+        # Server-Timing header value for a finished request, warning about N+1 queries.
+        # Also used by the async handlers of asgi.py with a recording() recorder.
+        for statement, times in recorder.repeated(self.repeat_threshold):
+            self.logger.warning('Possible N+1 query in %s %s: ran %d times: %s', method, path, times, statement)
+        return f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"'
+
+sql_profiler = SQLProfiler()
+
+
+@contextmanager
+def recording():
+    # Records the statements run by the current thread or asyncio task in the block
+    recorder = QueryRecorder()
+    install()
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None):
+    # Fails with AssertionError when the block runs more than max_queries statements,
+    # or one statement shape more than max_repeats times:
+    #
+    #   with query_budget(3):
+    #       client.post('/favorites/planets/1/2')
+    with recording() as recorder:
+        yield recorder
+
+    if recorder.count > max_queries:
+        statements = '\n'.join(f'{times} x {statement}' for statement, times in recorder.statements.most_common())
+        raise AssertionError(f'{recorder.count} queries, the budget is {max_queries}:\n{statements}')
+    if max_repeats is not None:
+        repeated = recorder.repeated(max_repeats)
+        if repeated:
+            statement, times = repeated[0]
+            raise AssertionError(f'Statement ran {times} times, the budget is {max_repeats}: {statement}')
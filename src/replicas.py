@@ -0,0 +1,112 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, create_engine, event, exc
+
+class ReplicaRouter:
+    # Spreads the reads of the views decorated with @read_replica over the replica
+    # engines, round robin, one replica per request. Everything else (writes, the
+    # flush, reads of other views) stays on the primary. Reads also go to the
+    # primary when no replica is healthy, and for max_lag seconds after this
+    # process committed a write, so a client reading right after its own write
+    # does not get a replica that has not caught up yet.
+    #
+    # max_lag is a guess, not a measure of how far behind the replicas are, and
+    # writes of other processes are not seen at all. Responses read from a replica
+    # are therefore never stored in the response cache nor given validators (see
+    # served_by_replica()): a lagging replica can serve one stale response, but
+    # that response is not repeated to other clients or confirmed by 304s later.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.engines = []
+        self._cycle = iter(())
+        self._down_until = {}
+        self.max_lag = 1.0
+        self.retry_interval = 30.0
+        self.last_write = 0.0
+
+    def configure(self, urls, engine_options, max_lag=None, retry_interval=None):
+        self.engines = [create_engine(url, **engine_options(url)) for url in urls]
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._handle_error)
+        self._cycle = itertools.cycle(self.engines)
+        if max_lag is not None:
+            self.max_lag = max_lag
+        if retry_interval is not None:
+            self.retry_interval = retry_interval
+
+    def note_write(self, tables, rows=None):
+        # table_versions listener: called after every committed write
+        self.last_write = time.monotonic()
+
+    def choose(self):
+        # Next healthy replica, or None to use the primary
+        now = time.monotonic()
+        if not self.engines or now - self.last_write < self.max_lag:
+            return None
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = next(self._cycle)
+                if self._down_until.get(engine, 0) <= now:
+                    return engine
+        return None
+
+    def mark_down(self, engine):
+        # Skip the replica until retry_interval has passed, then try it again
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_interval
+
+    def _handle_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.mark_down(context.engine)
+            if has_request_context():
+                g.replica_failed = True
+
+    def health(self):
+        now = time.monotonic()
+        return [
+            {'url': engine.url.render_as_string(hide_password=True), 'healthy': self._down_until.get(engine, 0) <= now}
+            for engine in self.engines
+        ]
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    # db.session class sending the SELECTs of @read_replica views to a replica
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and isinstance(clause, Select)
+                and not self._flushing
+                and has_request_context()
+                and g.get('read_replica')):
+            if 'replica_engine' not in g:
+                g.replica_engine = replica_router.choose()
+            if g.replica_engine is not None:
+                return g.replica_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def served_by_replica():
+    # Whether the current request read from a replica
+    return has_request_context() and g.get('replica_engine') is not None
+
+def read_replica(view):
+    # Decorator for idempotent GET views whose reads may be served by a replica.
+    # When the replica fails during the request, the view runs again on the primary.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        response = view(*args, **kwargs)
+        if g.pop('replica_failed', False):
+            current_app.extensions['sqlalchemy'].session.rollback()
+            g.read_replica = False
+            g.pop('replica_engine', None)
+            response = view(*args, **kwargs)
+        return response
+    return wrapper
@@ -0,0 +1,219 @@
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from flask import request, jsonify
+from utils import APIException, get_page_args, paginate_rows, get_fields_arg, load_fields, select_fields, rows_to_dicts, get_filter_args
+from versioning import conditional, table_versions
+from response_cache import cached
+from replicas import read_replica
+from bulk import import_columns, validate_row
+from search import search_index
+from stats import catalog_stats
+from json_provider import list_response
+from models import db, Favorites
+
+@lru_cache(maxsize=256)
+def compile_serializer(names):
+    # Serializer for one fieldset, cached so sparse ?fields= requests reuse theirs.
+    # Loaded columns live in the instance __dict__, so one itemgetter call reads
+    # them all without going through the ORM attribute descriptors (about 3x
+    # faster than serialize()). Columns not loaded, e.g. expired by a commit, fall
+    # back to attribute access, which loads them.
+    if len(names) == 1:
+        names = (names[0], names[0])
+    loaded = itemgetter(*names)
+    load = attrgetter(*names)
+
+    def serialize(obj):
+        try:
+            values = loaded(obj.__dict__)
+        except KeyError:
+            values = load(obj)
+        return dict(zip(names, values))
+    return serialize
+
+class Resource:
+    # One catalog type served by the generic CRUD routes. Everything the handlers
+    # need per request (columns, sort keys, serializer) is worked out here once.
+
+    def __init__(self, name, model, key, label, favorite_column, write_key=None):
+        self.name = name
+        self.model = model
+        self.table = model.__tablename__
+        # Key of a single item in the GET response bodies, the one of the POST and
+        # PUT responses when it differs (species) and the label used in messages
+        self.key = key
+        self.write_key = write_key or key
+        self.label = label
+        self.favorite_column = getattr(Favorites, favorite_column)
+        self.field_names = tuple(model.field_names())
+        # Columns a POST or PUT body may set: everything but the autoincrement id
+        self.columns = import_columns(model)
+        self.serialize = compile_serializer(self.field_names)
+
+    def serializer(self, fields):
+        # Same output as to_dict(fields): the full serializer or the sparse fieldset one
+        return self.serialize if fields is None else compile_serializer(tuple(fields))
+
+    def read_body(self):
+        # Validated {column: value} of a POST or PUT body, missing columns as None.
+        # Call this outside of the handler try/except so errors become 400s.
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise APIException('Expected a JSON object', status_code=400)
+        data.pop('id', None)
+        try:
+            return validate_row(self.columns, data)
+        except ValueError as e:
+            raise APIException(str(e), status_code=400)
+
+    def delete(self, ids):
+        # Set-based delete: one DELETE for the favorites pointing at the items and one
+        # for the items themselves. ON DELETE CASCADE would cover the favorites, but
+        # SQLite only enforces it with PRAGMA foreign_keys, so delete them explicitly.
+        # Returns the set of ids that existed and were deleted.
+        #
+        # The stats columns of the rows are read first, locked until the commit, so
+        # the aggregates can subtract them instead of rescanning the table.
+        columns = catalog_stats.columns(self.table)
+        rows = db.session.query(self.model.id, *[getattr(self.model, column) for column in columns]) \
+            .filter(self.model.id.in_(ids)).with_for_update().all()
+        deleted = {row[0] for row in rows}
+        if deleted:
+            Favorites.query.filter(self.favorite_column.in_(deleted)).delete(synchronize_session=False)
+            self.model.query.filter(self.model.id.in_(deleted)).delete(synchronize_session=False)
+        db.session.commit()
+
+        # Bulk statements skip the ORM flush hooks
+        if deleted:
+            table_versions.bump(self.table, 'favorites', rows={(self.table, item_id) for item_id in deleted})
+            search_index.remove(self.table, deleted)
+            catalog_stats.apply([(self.table, dict(zip(columns, row[1:])), None) for row in rows])
+        return deleted
+
+    # Handlers shared by every catalog type
+
+    def list_items(self):
+        # Read the page size, sort column, cursor, sparse fieldset and column filters
+        limit, sort, cursor = get_page_args(self.field_names)
+        fields = get_fields_arg(self.model)
+        filters = get_filter_args(self.model)
+        try:
+            # One page of matching rows as plain tuples of the requested columns,
+            # mapped straight to dicts without building ORM objects
+            statement, names = select_fields(self.model, fields, sort.lstrip('-'))
+            rows, next_url = paginate_rows(db.session, statement.where(*filters), self.model, limit, sort, cursor)
+            if not rows:
+                return jsonify({'error': f'No {self.name} found'}), 404
+
+            return list_response(self.name, rows_to_dicts(names, rows), next=next_url), 200
+
+        except Exception as e:
+            return jsonify({'error': f'Failed to retrieve {self.name}', 'details': str(e)}), 500
+
+    def get_item(self, id):
+        fields = get_fields_arg(self.model)
+        try:
+            row = load_fields(self.model.query, self.model, fields).get(id)
+            if not row:
+                return jsonify({'error': f'{self.label} not found'}), 404
+
+            return jsonify({self.key: self.serializer(fields)(row)}), 200
+
+        except Exception as e:
+            return jsonify({'error': f'Failed to retrieve {self.label.lower()}', 'details': str(e)}), 500
+
+    def create_item(self):
+        values = self.read_body()
+        try:
+            row = self.model(**values)
+            db.session.add(row)
+            db.session.commit()
+
+            response_body = {
+                "success": f"{self.label} created successfully",
+                self.write_key: self.serialize(row)
+            }
+
+            return jsonify(response_body), 201
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to create {self.label.lower()}', 'details': str(e)}), 500
+
+    def update_item(self, id):
+        # PUT replaces the whole item: columns missing from the body become NULL
+        values = self.read_body()
+        try:
+            row = db.session.get(self.model, id)
+            if row is None:
+                return jsonify({'error': f'{self.label} with ID {id} not found'}), 404
+
+            for column, value in values.items():
+                setattr(row, column, value)
+            db.session.commit()
+
+            response_body = {
+                "success": f"{self.label} with ID {id} updated successfully",
+                self.write_key: self.serialize(row)
+            }
+
+            return jsonify(response_body), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to update {self.label.lower()}', 'details': str(e)}), 500
+
+    def delete_item(self, id):
+        try:
+            # Delete the item and its favorites, checking if the item existed
+            if not self.delete([id]):
+                return jsonify({'error': f'{self.label} with ID {id} not found'}), 404
+
+            return jsonify({"success": f"{self.label} with ID {id} deleted successfully"}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to delete {self.label.lower()}', 'details': str(e)}), 500
+
+class ResourceRegistry:
+    # Catalog types by their URL name. Each is declared once with register(), which
+    # also indexes it for search and stats; init_routes() then adds the same five
+    # routes for every one of them.
+
+    def __init__(self):
+        self.resources = {}
+
+    def register(self, name, model, key, label, favorite_column, write_key=None, numeric=(), groups=()):
+        self.resources[name] = Resource(name, model, key, label, favorite_column, write_key)
+        search_index.register(model)
+        catalog_stats.register(model, numeric=numeric, groups=groups)
+
+    def __iter__(self):
+        return iter(self.resources.values())
+
+    def __contains__(self, name):
+        return name in self.resources
+
+    def get(self, name):
+        resource = self.resources.get(name)
+        if resource is None:
+            raise APIException(f'Unknown catalog {name}. Use one of: {", ".join(self.resources)}', status_code=404)
+        return resource
+
+    def models(self):
+        return {name: resource.model for name, resource in self.resources.items()}
+
+    def init_routes(self, blueprint):
+        # Endpoints are named like the handlers they replaced: get_characters for the
+        # list, get_character, post_character, put_character and delete_character
+        for resource in self:
+            table = resource.table
+            list_view = conditional(table)(cached(table)(read_replica(resource.list_items)))
+            item_view = conditional(table)(cached(table, item_arg='id')(read_replica(resource.get_item)))
+            blueprint.add_url_rule(f'/{resource.name}', f'get_{resource.name}', list_view, methods=['GET'])
+            blueprint.add_url_rule(f'/{resource.name}/<int:id>', f'get_{resource.key}', item_view, methods=['GET'])
+            blueprint.add_url_rule(f'/{resource.name}', f'post_{resource.key}', resource.create_item, methods=['POST'])
+            blueprint.add_url_rule(f'/{resource.name}/<int:id>', f'put_{resource.key}', resource.update_item, methods=['PUT'])
+            blueprint.add_url_rule(f'/{resource.name}/<int:id>', f'delete_{resource.key}', resource.delete_item, methods=['DELETE'])
+
+resources = ResourceRegistry()
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, current_app, make_response
+from versioning import table_versions
+from replicas import served_by_replica
+
+class ResponseCache:
+    # Bounded in-memory cache of encoded GET responses with LRU eviction and a TTL.
+    # Entries hold the response bytes, so a hit skips the database and the JSON
+    # encoding entirely. Each entry is tagged with (table, id), or (table, None) for
+    # responses built from many rows, and committed writes drop only the entries
+    # whose tags they touch. Entries also keep the compressed variants of their
+    # body made by CompressionMiddleware, counted in their size.
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=10000, ttl=60):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        table_versions.subscribe(self.invalidate)
+
+    def configure(self, max_bytes=None, max_entries=None, ttl=None):
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry['expires'] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, tag, body, status, mimetype):
+        size = len(key) + len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'tag': tag,
+                'body': body,
+                'status': status,
+                'mimetype': mimetype,
+                'variants': {},
+                'size': size,
+                'expires': time.monotonic() + self.ttl
+            }
+            self._tags.setdefault(tag, set()).add(key)
+            self.size += size
+            self._evict()
+
+    def variant(self, key, body, encoding):
+        # Compressed body of the entry, if the entry still holds this body
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['body'] != body:
+                return None
+            return entry['variants'].get(encoding)
+
+    def add_variant(self, key, body, encoding, compressed):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['body'] != body or encoding in entry['variants']:
+                return
+            entry['variants'][encoding] = compressed
+            entry['size'] += len(compressed)
+            self.size += len(compressed)
+            self._evict()
+
+    def invalidate(self, tables, rows=None):
+        # Called by table_versions after every committed write. Lists built from a
+        # table always go; single items only when their row changed (or for bulk
+        # writes where rows is None).
+        with self._lock:
+            tags = [(table, None) for table in tables]
+            if rows is None:
+                tags.extend(tag for tag in self._tags if tag[0] in tables)
+            else:
+                tags.extend(rows)
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry['size']
+        keys = self._tags.get(entry['tag'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[entry['tag']]
+
+    def _evict(self):
+        while self._entries and (self.size > self.max_bytes or len(self._entries) > self.max_entries):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+response_cache = ResponseCache()
+
+
+def cache_key():
+    # Same resource and same parameters in any order share one entry
+    args = sorted(request.args.items(multi=True))
+    return f'{request.path}?{urlencode(args)}'
+
+def cached(table, item_arg=None):
+    # Decorator for GET views. item_arg names the view argument holding the row id
+    # for single-item views; list views are tagged with the whole table.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache_key()
+            entry = response_cache.get(key)
+            if entry is not None:
+                # Lets CompressionMiddleware reuse the compressed variants of the entry
+                request.environ['response_cache.key'] = key
+                return current_app.response_class(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+
+            # Only store the response if no write committed while it was being built,
+            # and not when a replica served it: the replica may be behind the primary
+            version = table_versions.get(table)[0]
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and table_versions.get(table)[0] == version and not served_by_replica():
+                tag = (table, kwargs[item_arg] if item_arg else None)
+                response_cache.set(key, tag, response.get_data(), response.status_code, response.mimetype)
+                request.environ['response_cache.key'] = key
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,278 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from sqlalchemy import String, event
+from sqlalchemy.orm import Session, load_only
+from models import db
+from versioning import multiple_workers
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Matches in the name count more than matches in the other text columns
+NAME_WEIGHT = 3.0
+FIELD_WEIGHT = 1.0
+
+# Rows fetched per round trip when building the index
+BUILD_BATCH_SIZE = 1000
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+class SearchIndex:
+    # In-memory inverted index over the text columns of the catalog models.
+    # postings maps a token to {(table, id): weight}; docs keeps, for every indexed
+    # row, its name and weighted terms so updates can remove the old postings.
+    # Committed ORM writes update it incrementally (see the session hooks below);
+    # bulk Core writes call remove() or mark_stale().
+    #
+    # Tables are built by a background thread started with the server (see
+    # start_build()), never inside a request: the table scan runs without the
+    # lock, rows go in one batch per lock hold, and changes committed meanwhile
+    # are queued and replayed once the scan is done. Searches of a table not
+    # built yet are answered with "not ready" (see missing()).
+    #
+    # The index only sees the writes committed by this process. A refresh scans a
+    # table again the same way and applies the differences, while the table stays
+    # searchable: bulk writes refresh their table, and with several workers every
+    # table is refreshed each refresh_interval() seconds, which bounds how long
+    # the writes of the other workers take to show up.
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.models = {}
+        self.postings = {}
+        self.docs = {}
+        self._built = set()
+        # Tables being built -> changes committed during the build, replayed after it
+        self._building = {}
+        # Tables changed in bulk while being built: built again once the build ends
+        self._again = set()
+        self._app = None
+        self._refresher = None
+        self._refresh_interval = None
+        # Build threads do not survive a fork (gunicorn --preload): start over in the child
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, model):
+        columns = [column.key for column in model.__table__.columns if isinstance(column.type, String)]
+        self.models[model.__tablename__] = (model, columns)
+
+    def document(self, table, values):
+        # Weighted term frequencies for one row, from {column: value}
+        terms = Counter()
+        for column in self.models[table][1]:
+            weight = NAME_WEIGHT if column == 'name' else FIELD_WEIGHT
+            for token in tokenize(values.get(column)):
+                terms[token] += weight
+        return terms
+
+    def snapshot(self, obj):
+        # Capture the indexed values of an ORM object while they are still loaded
+        return {column: getattr(obj, column) for column in self.models[obj.__tablename__][1]}
+
+    def put(self, table, item_id, values):
+        doc = (values.get('name'), self.document(table, values))
+        with self._lock:
+            self._store((table, item_id), doc)
+
+    def _store(self, key, doc):
+        self._remove(*key)
+        self.docs[key] = doc
+        for token, weight in doc[1].items():
+            self.postings.setdefault(token, {})[key] = weight
+
+    def remove(self, table, ids):
+        self.apply({(table, item_id): None for item_id in ids})
+
+    def _remove(self, table, item_id):
+        doc = self.docs.pop((table, item_id), None)
+        if doc is None:
+            return
+        for token in doc[1]:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop((table, item_id), None)
+                if not postings:
+                    del self.postings[token]
+
+    def apply(self, changes):
+        # changes maps (table, id) to the new values, or None for deleted rows.
+        # Tables that are not built yet will pick the rows up when they are.
+        with self._lock:
+            for (table, item_id), values in changes.items():
+                if table in self._building:
+                    self._building[table].append((item_id, values))
+                if values is None:
+                    self._remove(table, item_id)
+                elif table in self._built:
+                    self.put(table, item_id, values)
+
+    def mark_stale(self, table):
+        # The table was changed behind the ORM's back: refresh it in the background
+        if self._app is not None:
+            self.refresh([table])
+
+    def refresh_interval(self):
+        # Seconds between refreshes of every table: SEARCH_REFRESH_INTERVAL, by
+        # default 60 with several workers and never (0) with a single one
+        if self._refresh_interval is None:
+            setting = os.environ.get('SEARCH_REFRESH_INTERVAL')
+            self._refresh_interval = float(setting) if setting else (60 if multiple_workers() else 0)
+        return self._refresh_interval
+
+    def start_build(self, app, tables=None):
+        # Build the given tables (default: all) that are not built yet, in a daemon
+        # thread with its own app context, and start the periodic refreshes
+        self._app = app
+        self.refresh([table for table in (tables or self.models) if table not in self._built], again=False)
+        if self.refresh_interval() and self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_periodically, name='search-index-refresh', daemon=True)
+            self._refresher.start()
+
+    def refresh(self, tables, again=True):
+        # Scan the tables again in the background. Tables being built are built
+        # again once done when again is set, and left alone otherwise.
+        with self._lock:
+            if again:
+                self._again.update(table for table in tables if table in self._building)
+            tables = [table for table in tables if table not in self._building]
+            for table in tables:
+                self._building[table] = []
+        if tables:
+            threading.Thread(target=self._build, args=(self._app, tables), name='search-index-build', daemon=True).start()
+
+    def _refresh_periodically(self):
+        while True:
+            time.sleep(self.refresh_interval())
+            self.refresh(list(self.models), again=False)
+
+    def missing(self, tables=None):
+        # Requested tables that cannot be searched yet. Starts building the ones
+        # nobody is building, e.g. after a failed build.
+        tables = [table for table in (tables or self.models) if table not in self._built]
+        if tables and self._app is not None:
+            self.refresh(tables, again=False)
+        return tables
+
+    def _build(self, app, tables):
+        with app.app_context():
+            for table in tables:
+                try:
+                    self._build_table(table)
+                except Exception:
+                    app.logger.exception('Building the search index of %s failed', table)
+                    with self._lock:
+                        self._building.pop(table, None)
+                        self._again.discard(table)
+                finally:
+                    db.session.remove()
+
+    def _build_table(self, table):
+        model, columns = self.models[table]
+        query = model.query.options(load_only(*[getattr(model, column) for column in columns])).order_by(model.id)
+        seen = set()
+        batch = []
+        for row in query.yield_per(BUILD_BATCH_SIZE):
+            values = self.snapshot(row)
+            batch.append(((table, row.id), (values.get('name'), self.document(table, values))))
+            if len(batch) >= BUILD_BATCH_SIZE:
+                seen.update(self._store_batch(batch))
+                batch = []
+        seen.update(self._store_batch(batch))
+
+        with self._lock:
+            # Rows indexed before but gone from the table
+            for key in [key for key in self.docs if key[0] == table and key not in seen]:
+                self._remove(*key)
+            # Replay what committed during the scan, over the possibly older scanned values
+            for item_id, values in self._building.pop(table):
+                if values is None:
+                    self._remove(table, item_id)
+                else:
+                    self.put(table, item_id, values)
+            self._built.add(table)
+            again = table in self._again
+            self._again.discard(table)
+        if again:
+            self.refresh([table])
+
+    def _store_batch(self, batch):
+        # Index the scanned rows that differ from what the index holds
+        with self._lock:
+            for key, doc in batch:
+                if self.docs.get(key) != doc:
+                    self._store(key, doc)
+        return [key for key, _ in batch]
+
+    def _after_fork(self):
+        self._lock = threading.RLock()
+        interrupted = [table for table in self._building if table in self._built]
+        self._building = {}
+        self._again = set()
+        self._refresher = None
+        if self._app is not None:
+            self.refresh(interrupted)
+            self.start_build(self._app)
+
+    def search(self, text, tables=None, limit=20, offset=0):
+        # Rows containing every query token, ranked by weighted tf-idf.
+        # Returns (total matches, [(score, table, id, name)]) for the requested page.
+        # Only covers built tables: check missing() first.
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if not tokens:
+            return 0, []
+
+        with self._lock:
+            postings = [self.postings.get(token) for token in tokens]
+            if not all(postings):
+                return 0, []
+
+            # Intersect starting from the rarest token
+            postings.sort(key=len)
+            candidates = postings[0].keys()
+            for other in postings[1:]:
+                # Probe the larger postings instead of iterating them
+                candidates = [key for key in candidates if key in other]
+                if not candidates:
+                    return 0, []
+            # Tables built for the first time hold part of their rows only
+            candidates = [key for key in candidates if key[0] in self._built and (tables is None or key[0] in tables)]
+
+            total_docs = len(self.docs)
+            idf = [math.log(1 + (total_docs - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+            scored = ((sum(p[key] * weight for p, weight in zip(postings, idf)), key) for key in candidates)
+            top = heapq.nlargest(offset + limit, scored, key=lambda item: (item[0], -item[1][1]))
+
+            page = [(round(score, 4), table, item_id, self.docs[(table, item_id)][0]) for score, (table, item_id) in top[offset:]]
+            return len(candidates), page
+
+search_index = SearchIndex()
+
+
+# Keep the index in step with committed ORM writes. Values are captured at flush
+# time, while the objects are loaded, and applied only once the commit succeeds.
+@event.listens_for(Session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    changes = session.info.setdefault('search_changes', {})
+    for obj in (*session.new, *session.dirty):
+        table = getattr(obj, '__tablename__', None)
+        if table in search_index.models:
+            changes[(table, obj.id)] = search_index.snapshot(obj)
+    for obj in session.deleted:
+        table = getattr(obj, '__tablename__', None)
+        if table in search_index.models:
+            changes[(table, obj.id)] = None
+
+@event.listens_for(Session, 'after_commit')
+def _apply_search_changes(session):
+    changes = session.info.pop('search_changes', None)
+    if changes:
+        search_index.apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('search_changes', None)
@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from collections import Counter
+import click
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+from bulk import insert_ignore
+from models import db, StatsEpoch
+from versioning import multiple_workers
+
+# Label used in distributions for rows where the grouped column is NULL
+UNKNOWN = 'unknown'
+
+class CatalogStats:
+    # In-memory aggregates per catalog table: row count, count and sum of numeric
+    # columns (for averages) and value counts of grouped columns. Committed ORM
+    # writes adjust them by the difference between the old and new row values,
+    # so reading the stats never scans a table. A table is (re)built with GROUP BY
+    # queries on first use, after mark_stale(), expire() or on rebuild().
+    #
+    # Builds run outside the lock. Every change to a table bumps its generation,
+    # and a build only keeps its result when no change arrived while its queries
+    # ran; otherwise the table is built again on next use.
+    #
+    # The aggregates only see the writes committed by this process. With several
+    # workers, aggregates older than max_age() are rebuilt on read, which bounds
+    # how far they drift from the writes of the other workers. Rebuilds and bulk
+    # writes go through expire(), which bumps the table's row in stats_epochs so
+    # that every process rebuilds it on its next sync().
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.definitions = {}
+        self.tables = {}
+        self._generations = Counter()
+        self._build_locks = {}
+        self._built_at = {}
+        self._epochs = {}
+        self._max_age = None
+
+    def init_app(self, app):
+        @app.cli.command('rebuild-stats')
+        def rebuild_stats():
+            """Recompute the /stats aggregates, in every running server too."""
+            self.rebuild()
+            for table in self.definitions:
+                click.echo(f'{table}: {self.summary(table)["count"]} rows')
+
+    def register(self, model, numeric=(), groups=()):
+        self.definitions[model.__tablename__] = (model, tuple(numeric), tuple(groups))
+        self._build_locks[model.__tablename__] = threading.Lock()
+
+    def columns(self, table):
+        _, numeric, groups = self.definitions[table]
+        return numeric + groups
+
+    def _apply(self, table, values, sign):
+        stats = self.tables[table]
+        _, numeric, groups = self.definitions[table]
+        stats['count'] += sign
+        for column in numeric:
+            if values[column] is not None:
+                stats['numeric'][column][0] += sign
+                stats['numeric'][column][1] += sign * float(values[column])
+        for column in groups:
+            key = values[column] if values[column] is not None else UNKNOWN
+            counter = stats['groups'][column]
+            counter[key] += sign
+            if counter[key] <= 0:
+                del counter[key]
+
+    def apply(self, changes):
+        # changes is a list of (table, old values or None, new values or None).
+        # old values are False when they could not be captured: rebuild that table.
+        with self._lock:
+            for table, old, new in changes:
+                self._generations[table] += 1
+                if table not in self.tables:
+                    continue
+                if old is False:
+                    del self.tables[table]
+                    continue
+                try:
+                    if old is not None:
+                        self._apply(table, old, -1)
+                    if new is not None:
+                        self._apply(table, new, 1)
+                except (TypeError, ValueError):
+                    # A value the aggregates cannot handle: let the database recompute them
+                    del self.tables[table]
+
+    def mark_stale(self, table):
+        with self._lock:
+            self._generations[table] += 1
+            self.tables.pop(table, None)
+
+    def max_age(self):
+        # Seconds before built aggregates are rebuilt on read: STATS_MAX_AGE, by
+        # default 60 with several workers and no limit (0) with a single one
+        if self._max_age is None:
+            setting = os.environ.get('STATS_MAX_AGE')
+            self._max_age = float(setting) if setting else (60 if multiple_workers() else 0)
+        return self._max_age
+
+    def sync(self):
+        # Drop the aggregates of the tables expired by any process since this one
+        # last looked. One read of the few stats_epochs rows: call it once per request.
+        epochs = dict(db.session.execute(select(StatsEpoch.table_name, StatsEpoch.epoch)).all())
+        for table in self.definitions:
+            epoch = epochs.get(table, 0)
+            with self._lock:
+                if self._epochs.get(table, 0) == epoch:
+                    continue
+                self._epochs[table] = epoch
+            self.mark_stale(table)
+
+    def expire(self, *tables):
+        # Make every process rebuild these tables (default: all), e.g. after a
+        # bulk write. Commits the session.
+        tables = tables or tuple(self.definitions)
+        db.session.execute(insert_ignore(StatsEpoch.__table__), [{'table_name': table, 'epoch': 0} for table in tables])
+        db.session.execute(
+            update(StatsEpoch).where(StatsEpoch.table_name.in_(tables)).values(epoch=StatsEpoch.epoch + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        # This process rebuilds now, so it does not need to again at its next sync()
+        epochs = dict(db.session.execute(
+            select(StatsEpoch.table_name, StatsEpoch.epoch).where(StatsEpoch.table_name.in_(tables))
+        ).all())
+        with self._lock:
+            self._epochs.update(epochs)
+        for table in tables:
+            self.mark_stale(table)
+
+    def build(self, table):
+        # Returns the aggregates of the table, building them unless a concurrent
+        # build already did. One build per table at a time.
+        with self._build_locks[table]:
+            with self._lock:
+                if table in self.tables:
+                    return self.tables[table]
+                generation = self._generations[table]
+
+            stats = self._query(table)
+
+            with self._lock:
+                if self._generations[table] == generation:
+                    self.tables[table] = stats
+                    self._built_at[table] = time.monotonic()
+            return stats
+
+    def _query(self, table):
+        model, numeric, groups = self.definitions[table]
+        stats = {'count': 0, 'numeric': {}, 'groups': {}}
+
+        aggregates = [func.count(model.id)]
+        for column in numeric:
+            aggregates += [func.count(getattr(model, column)), func.sum(getattr(model, column))]
+        row = db.session.query(*aggregates).one()
+        stats['count'] = row[0]
+        for index, column in enumerate(numeric):
+            stats['numeric'][column] = [row[1 + 2 * index], float(row[2 + 2 * index] or 0)]
+
+        for column in groups:
+            attribute = getattr(model, column)
+            stats['groups'][column] = Counter({
+                (value if value is not None else UNKNOWN): count
+                for value, count in db.session.query(attribute, func.count(model.id)).group_by(attribute)
+            })
+        return stats
+
+    def rebuild(self):
+        self.expire()
+        for table in self.definitions:
+            self.build(table)
+
+    def summary(self, table):
+        with self._lock:
+            stats = self.tables.get(table)
+            if stats is not None and self.max_age() and time.monotonic() - self._built_at[table] > self.max_age():
+                # Too old to trust with other workers writing: build them again
+                del self.tables[table]
+                stats = None
+        if stats is None:
+            stats = self.build(table)
+        # Read the object found or built, not self.tables again: a concurrent
+        # mark_stale() may have dropped it in between
+        with self._lock:
+            return {
+                'count': stats['count'],
+                'averages': {
+                    column: round(total / count, 2) if count else None
+                    for column, (count, total) in stats['numeric'].items()
+                },
+                'distributions': {
+                    column: dict(counter.most_common())
+                    for column, counter in stats['groups'].items()
+                }
+            }
+
+catalog_stats = CatalogStats()
+
+
+def _old_values(obj, columns):
+    # Values before the flush, from the attribute history; False if unknown
+    state = inspect(obj)
+    values = {}
+    for column in columns:
+        history = state.attrs[column].history
+        if history.deleted:
+            values[column] = history.deleted[0]
+        elif history.unchanged:
+            values[column] = history.unchanged[0]
+        elif not history.added:
+            values[column] = None
+        else:
+            return False
+    return values
+
+
+# Adjust the aggregates from committed ORM writes, capturing old and new values
+# at flush time while the attribute history is still available.
+@event.listens_for(Session, 'after_flush')
+def _collect_stats_changes(session, flush_context):
+    changes = session.info.setdefault('stats_changes', [])
+    for obj in session.new:
+        table = getattr(obj, '__tablename__', None)
+        if table in catalog_stats.definitions:
+            columns = catalog_stats.columns(table)
+            changes.append((table, None, {column: getattr(obj, column) for column in columns}))
+    for obj in session.dirty:
+        table = getattr(obj, '__tablename__', None)
+        if table in catalog_stats.definitions and session.is_modified(obj):
+            columns = catalog_stats.columns(table)
+            changes.append((table, _old_values(obj, columns), {column: getattr(obj, column) for column in columns}))
+    for obj in session.deleted:
+        table = getattr(obj, '__tablename__', None)
+        if table in catalog_stats.definitions:
+            changes.append((table, _old_values(obj, catalog_stats.columns(table)), None))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_stats_changes(session):
+    changes = session.info.pop('stats_changes', None)
+    if changes:
+        catalog_stats.apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stats_changes(session):
+    session.info.pop('stats_changes', None)
@@ -1,4 +1,31 @@
-from flask import jsonify, url_for
+import base64
+import json
+import re
+from flask import jsonify, url_for, request
+from sqlalchemy import Boolean, Integer, String, and_, or_, select
+from sqlalchemy.orm import load_only
+
+# Page size used by the list endpoints when ?limit= is not given
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Query string arguments that are not column filters on the list endpoints
+PAGE_ARGS = ('limit', 'after', 'sort', 'fields')
+
+# ?column[op]=value filters
+FILTER_ARG_RE = re.compile(r'^(\w+)(?:\[(\w+)\])?$')
+FILTER_OPERATORS = {
+    'eq': lambda column, value: column == value,
+    'ne': lambda column, value: column != value,
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+    'in': lambda column, value: column.in_(value),
+    'between': lambda column, value: column.between(*value),
+    'contains': lambda column, value: column.contains(value, autoescape=True),
+    'null': lambda column, value: column.is_(None) if value else column.is_not(None)
+}
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +42,206 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def get_fields_arg(model, args=None):
+    # Parse ?fields=name,height into a list of column names, always including the id.
+    # Returns None when the client wants every field.
+    args = request.args if args is None else args
+    raw = args.get('fields')
+    if not raw:
+        return None
+
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    allowed = model.field_names()
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise APIException(f'Unknown field(s): {", ".join(unknown)}', status_code=400, payload={'allowed_fields': allowed})
+
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def load_fields(query, model, fields, *extra):
+    # Restrict the SELECT to the requested columns (plus any the handler needs itself)
+    if fields is None:
+        return query
+    columns = dict.fromkeys([*fields, *extra])
+    return query.options(load_only(*[getattr(model, column) for column in columns]))
+
+def select_fields(model, fields, *extra):
+    # Core counterpart of load_fields() for read-only list paths: a select() of the
+    # requested columns (all public ones when fields is None, plus any the handler
+    # needs itself) straight off the table. Rows come back as plain tuples, with no
+    # ORM instances, identity map or attribute instrumentation to build per row.
+    # Returns the statement and the output field names, which come first in every row.
+    names = tuple(model.field_names() if fields is None else fields)
+    columns = model.__table__.c
+    return select(*[columns[column] for column in dict.fromkeys([*names, *extra])]), names
+
+def rows_to_dicts(names, rows):
+    # Output mappings of select_fields() rows; zip() drops the trailing extra columns
+    return [dict(zip(names, row)) for row in rows]
+
+def encode_cursor(values):
+    # The cursor is opaque to clients: urlsafe base64 of a compact JSON list
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise APIException('Invalid pagination cursor', status_code=400)
+    # [sort, value of the sort column, id]; bool is an int subclass, so exclude it
+    if (not isinstance(values, list) or len(values) != 3
+            or not isinstance(values[0], str)
+            or isinstance(values[1], (list, dict))
+            or not isinstance(values[2], int) or isinstance(values[2], bool)):
+        raise APIException('Invalid pagination cursor', status_code=400)
+    return values
+
+def get_page_args(sort_keys, args=None):
+    # Read ?limit=, ?sort= and ?after= from the current request (or the given args).
+    # sort is a column name, prefixed with - for descending order.
+    # Call this outside of the handler try/except so errors become 400s.
+    args = request.args if args is None else args
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise APIException('Limit must be an integer', status_code=400)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise APIException(f'Limit must be between 1 and {MAX_PAGE_SIZE}', status_code=400)
+
+    sort = args.get('sort', sort_keys[0])
+    if sort.lstrip('-') not in sort_keys:
+        raise APIException(f'Cannot sort by {sort}. Use one of: {", ".join(sort_keys)}', status_code=400)
+
+    cursor = None
+    if args.get('after'):
+        cursor = decode_cursor(args['after'])
+        if cursor[0] != sort:
+            raise APIException('Pagination cursor does not match the sort order', status_code=400)
+
+    return limit, sort, cursor
+
+def keyset(query, model, limit, sort, cursor):
+    # Keyset pagination: order by (sort column, id) and continue strictly after
+    # the last row of the previous page, so every page is a single index range scan
+    # no matter how deep the client has paged. Works on ORM queries and select()s;
+    # for select_fields() statements pass the table columns (model.__table__.c).
+    pk = model.id
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    column = getattr(model, name)
+
+    if name == 'id':
+        query = query.order_by(pk.desc() if descending else pk)
+        if cursor is not None:
+            query = query.filter(pk < cursor[2] if descending else pk > cursor[2])
+    elif not column.nullable:
+        query = query.order_by(column.desc() if descending else column, pk)
+        if cursor is not None:
+            past = column < cursor[1] if descending else column > cursor[1]
+            query = query.filter(or_(past, and_(column == cursor[1], pk > cursor[2])))
+    else:
+        # NULLs sort last in both directions, the same on every database
+        query = query.order_by(column.is_(None), column.desc() if descending else column, pk)
+        if cursor is not None and cursor[1] is None:
+            query = query.filter(column.is_(None), pk > cursor[2])
+        elif cursor is not None:
+            past = column < cursor[1] if descending else column > cursor[1]
+            query = query.filter(or_(past, and_(column == cursor[1], pk > cursor[2]), column.is_(None)))
+
+    # Fetch one extra row to know whether there is a next page
+    return query.limit(limit + 1)
+
+def next_cursor(rows, limit, sort):
+    # Trim the extra row fetched by keyset() and return (rows, cursor of the next page or None)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([sort, getattr(last, sort.lstrip('-')), last.id])
+
+def next_page_url(after):
+    # Link to the current request continuing after the given cursor, or None
+    if after is None:
+        return None
+    args = request.args.to_dict(flat=False)
+    args['after'] = after
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def paginate_rows(session, statement, model, limit, sort, cursor):
+    # One keyset page of a select_fields() statement: (row tuples, next page link)
+    rows = session.execute(keyset(statement, model.__table__.c, limit, sort, cursor)).all()
+    rows, after = next_cursor(rows, limit, sort)
+    return rows, next_page_url(after)
+
+def parse_filter_value(column, raw):
+    if isinstance(column.type, Integer):
+        try:
+            return int(raw)
+        except ValueError:
+            # Accept numbers like 1e9 as long as they are whole
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f'{column.key} must be an integer')
+            if not value.is_integer():
+                raise ValueError(f'{column.key} must be an integer')
+            return int(value)
+    if isinstance(column.type, Boolean):
+        if raw.lower() not in ('true', 'false'):
+            raise ValueError(f'{column.key} must be true or false')
+        return raw.lower() == 'true'
+    return raw
+
+def get_filter_args(model, args=None):
+    # Compile ?column=value and ?column[op]=value into SQLAlchemy expressions.
+    # Values are cast to the column type and sent as bound parameters.
+    columns = {column.key: column for column in model.__table__.columns if column.key not in model.hidden_fields}
+    args = request.args if args is None else args
+    filters = []
+    for key, raw in args.items(multi=True):
+        if key in PAGE_ARGS:
+            continue
+        match = FILTER_ARG_RE.match(key)
+        if not match or match.group(1) not in columns:
+            raise APIException(f'Unknown filter {key}', status_code=400, payload={'allowed_fields': list(columns)})
+        column = columns[match.group(1)]
+        op = match.group(2) or 'eq'
+        if op not in FILTER_OPERATORS:
+            raise APIException(f'Unknown filter operator {op}. Use one of: {", ".join(FILTER_OPERATORS)}', status_code=400)
+
+        try:
+            if op == 'null':
+                if raw.lower() not in ('true', 'false'):
+                    raise ValueError('null takes true or false')
+                value = raw.lower() == 'true'
+            elif op in ('in', 'between'):
+                value = [parse_filter_value(column, part) for part in raw.split(',')]
+                if op == 'between' and len(value) != 2:
+                    raise ValueError('between takes two values: low,high')
+            elif op == 'contains':
+                if not isinstance(column.type, String):
+                    raise ValueError(f'{column.key} is not a text field')
+                value = raw
+            else:
+                value = parse_filter_value(column, raw)
+        except ValueError as e:
+            raise APIException(f'Invalid value for {key}: {e}', status_code=400)
+
+        filters.append(FILTER_OPERATORS[op](column, value))
+    return filters
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    # The admin UI is only there when create_app() enabled it
+    links = ['/admin/'] if 'admin' in app.extensions else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from replicas import served_by_replica
+
+def multiple_workers():
+    # Whether several server processes share the database: WEB_CONCURRENCY is set
+    # by gunicorn.conf.py from --workers and read by uvicorn as its worker count.
+    # In-process state then only sees the writes of its own worker.
+    return int(os.environ.get('WEB_CONCURRENCY') or 1) > 1
+
+class TableVersions:
+    # In-process version counter per table. Every committed write to a table bumps
+    # its counter, so a (table, counter) pair identifies the content of the table
+    # and can be turned into an ETag without querying the database.
+    #
+    # The counters live in the worker process and only see the writes it commits,
+    # see enabled() for deployments with several workers.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        # Counters restart from zero when the process restarts, so tag them with
+        # something unique to this process to never reuse an old ETag
+        self.boot_token = f'{os.getpid()}-{os.urandom(4).hex()}'
+        self.boot_time = datetime.now(timezone.utc)
+        self._listeners = []
+        self._enabled = None
+
+    def enabled(self):
+        # Whether the counters can answer conditional GETs. A write committed by
+        # another worker, the admin running in another process or `flask generate`
+        # never bumps this process's counters, so its clients would get 304s with
+        # stale data. Off when more than one worker is configured (see
+        # multiple_workers()); CONDITIONAL_GET=0 also turns it off when something
+        # else writes to the database. Read on first use, after the server has
+        # forked its workers.
+        if self._enabled is None:
+            setting = os.environ.get('CONDITIONAL_GET')
+            if setting:
+                self._enabled = setting.lower() in ('1', 'true', 'yes')
+            else:
+                self._enabled = not multiple_workers()
+        return self._enabled
+
+    def get(self, table):
+        return self._versions.get(table, (0, self.boot_time))
+
+    def bump(self, *tables, rows=None):
+        # rows is the set of (table, id) pairs that changed, or None when the
+        # whole tables must be considered changed (bulk statements)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for table in tables:
+                counter, _ = self._versions.get(table, (0, self.boot_time))
+                self._versions[table] = (counter + 1, now)
+        for listener in self._listeners:
+            listener(tables, rows)
+
+    def subscribe(self, listener):
+        # listener(tables, rows) is called after every bump
+        self._listeners.append(listener)
+
+    def validators(self, tables, key=''):
+        # Strong ETag and Last-Modified for a representation built from these tables
+        versions = [self.get(table) for table in tables]
+        raw = f'{self.boot_token}|{key}|' + '|'.join(f'{table}:{counter}' for table, (counter, _) in zip(tables, versions))
+        etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        last_modified = max(modified for _, modified in versions)
+        return etag, last_modified
+
+def not_modified_since(last_modified, since):
+    # If-Modified-Since only has whole seconds: the tables are unchanged if their
+    # last write happened in the second of the header or before
+    return last_modified.replace(microsecond=0) <= since
+
+def last_modified_header(last_modified):
+    # Last-Modified for a response, or None while the last write's second is still
+    # running: another write in that same second would carry the same date, and a
+    # client revalidating with it would get a 304 for data it has not seen
+    last_modified = last_modified.replace(microsecond=0)
+    if last_modified < datetime.now(timezone.utc).replace(microsecond=0):
+        return last_modified
+    return None
+
+table_versions = TableVersions()
+
+
+# Bump the counters from the ORM unit of work, so every write path (the API
+# handlers and the admin views alike) invalidates the validators once committed.
+# Bulk Core statements do not go through the flush and must call bump() themselves.
+@event.listens_for(Session, 'after_flush')
+def _collect_written_rows(session, flush_context):
+    tables = session.info.setdefault('written_tables', set())
+    rows = session.info.setdefault('written_rows', set())
+    for obj in session.new:
+        table = getattr(obj, '__tablename__', None)
+        if table is not None:
+            tables.add(table)
+    for obj in (*session.dirty, *session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        identity = inspect(obj).identity
+        if table is not None:
+            tables.add(table)
+            if identity is not None:
+                rows.add((table, identity[0]))
+
+@event.listens_for(Session, 'after_commit')
+def _bump_written_tables(session):
+    tables = session.info.pop('written_tables', None)
+    rows = session.info.pop('written_rows', None)
+    if tables:
+        table_versions.bump(*tables, rows=rows or set())
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+    session.info.pop('written_tables', None)
+    session.info.pop('written_rows', None)
+
+
+def conditional(*tables):
+    # Decorator for GET views: answers 304 Not Modified from the version counters
+    # alone, before the view touches the database. A no-op when the counters cannot
+    # see every write (see TableVersions.enabled()).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not table_versions.enabled():
+                return view(*args, **kwargs)
+
+            # The full path covers the view arguments, ?fields=, pagination, etc.
+            etag, last_modified = table_versions.validators(tables, request.full_path)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since:
+                not_modified = not_modified_since(last_modified, request.if_modified_since)
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # A replica may be behind the version the validators stand for
+                if response.status_code != 200 or served_by_replica():
+                    return response
+
+            response.set_etag(etag)
+            header = last_modified_header(last_modified)
+            if header is not None:
+                response.last_modified = header
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -1,7 +1,21 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
-from app import app as application
+from app import create_app
+from search import search_index
+from compression import CompressionMiddleware
+from response_cache import response_cache
+
+# Workers serve requests only: migrations run from the `flask db` CLI. Set
+# ENABLE_ADMIN=0 and ENABLE_SWAGGER=0 for API-only workers that boot faster.
+application = create_app(migrate=False)
+
+# Index the catalogs for /search in the background, /search answers 503 until done
+search_index.start_build(application)
+
+# Compress responses for clients that accept it (gzip, plus br/zstd when installed)
+# (COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_ZSTD_LEVEL)
+application.wsgi_app = CompressionMiddleware.from_env(application.wsgi_app, variant_cache=response_cache)
 
 if __name__ == "__main__":
     application.run()